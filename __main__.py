@@ -10,7 +10,9 @@ from trader.util.constants import (BCH_USD, BINANCE, BSV_USD, BTC_USD,
                                    BTC_USDT, EOS_USD, EOS_USDT, ETH_USD,
                                    ETH_USDT, LTC_USD, LTC_USDT, NEO_USDT,
                                    XRP_USD, XRP_USDT)
-from trader.util.thread import Beat, ThreadManager
+from trader.util.feed import FEEDS
+from trader.util.thread import Scheduler, ThreadManager
+from trader.util.trace import TRACER
 
 # should this be a global that lives in trader.util.thread?
 THREAD_MANAGER = ThreadManager()
@@ -31,8 +33,9 @@ def main():
     Log.info("Prepping warmup data.")
     converter = UsdConverter()
     aggregator = SignalAggregator(window_size, {"total_market": [p.base for p in pairs]})
-    warmup_data = warmup_data.apply(converter.step, axis=1)
-    warmup_signals = warmup_data.apply(aggregator.step, axis=1)
+    # The execution strategy trades in quote currencies, so only the signals are warmed up in USD.
+    warmup_data_usd = converter.step_frame(warmup_data)
+    warmup_signals = aggregator.step_frame(warmup_data_usd)
 
     Log.info("Initializing components.")
     kalman_strategy = strategy.Kalman(
@@ -41,23 +44,38 @@ def main():
         trend_hl=window_size,
         cointegration_period=720,
         warmup_signals=warmup_signals,
-        warmup_data=warmup_data,
+        warmup_data=warmup_data_usd,
     )
     execution_strategy = ExecutionStrategy(500, 1, 3, 45, 135, 60, 180, warmup_data)
     executor = Executor(THREAD_MANAGER, {bitfinex: pairs}, execution_strategy)
 
-    beat = Beat(60000)
-    while beat.loop():
+    scheduler = Scheduler()
+
+    # Ticks at the top of every minute, when the exchanges close their one minute candles.
+    def tick():
         Log.info("Beat")
+        trace_id = TRACER.start()
         bfx_frame = bitfinex.frame(pairs)
+        TRACER.stamp(trace_id, "frame")
         frame_usd = converter.step(bfx_frame)
         signals = aggregator.step(frame_usd)
+        TRACER.stamp(trace_id, "signals")
         kalman_fairs = kalman_strategy.tick(frame_usd, signals)
+        TRACER.stamp(trace_id, "fairs")
         fairs = kalman_fairs & Gaussian(
             frame_usd.xs("price", level=1), [1e100 for _ in frame_usd.xs("price", level=1).index]
         )
         Log.info("fairs", fairs)
-        executor.tick_fairs(fairs)
+        executor.tick_fairs(converter.unconvert(fairs), trace_id)
+
+    def dump():
+        TRACER.dump()
+        FEEDS.dump()
+        scheduler.dump()
+
+    scheduler.add("tick", tick, 60000)
+    scheduler.add("dump", dump, 3600000, phase=30000)
+    scheduler.run()
 
 
 def dummy_main():
@@ -72,8 +90,9 @@ def dummy_main():
     Log.info("Processing warmup data.")
     warmup_data = data.iloc[:window_size]
     data = data.iloc[window_size:]
-    warmup_data = warmup_data.apply(converter.step, axis=1)
-    warmup_signals = warmup_data.apply(aggregator.step, axis=1)
+    # The execution strategy trades in quote currencies, so only the signals are warmed up in USD.
+    warmup_data_usd = converter.step_frame(warmup_data)
+    warmup_signals = aggregator.step_frame(warmup_data_usd)
 
     Log.info("Initializing components.")
     kalman_strategy = strategy.Kalman(
@@ -82,7 +101,7 @@ def dummy_main():
         trend_hl=256,
         cointegration_period=96,
         warmup_signals=warmup_signals,
-        warmup_data=warmup_data,
+        warmup_data=warmup_data_usd,
     )
     # use same params for trend and micro trend because 15min is too wide for micro trends to have
     # effect
@@ -103,7 +122,7 @@ def dummy_main():
             frame_usd.xs("price", level=1), [1e100 for _ in frame_usd.xs("price", level=1).index]
         )
         Log.info("fairs", fairs)
-        executor.tick_fairs(fairs)
+        executor.tick_fairs(converter.unconvert(fairs))
     # TODO: analysis stuff
 
 
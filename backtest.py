@@ -127,7 +127,7 @@ def backtest_spark_job(input_path, sc):
         execution_strategy = ExecutionStrategy(10, 192, 1, 3, -0.5, 0.002, 0.0005, warmup_data)
         executor = executor(thread_manager, {dummy_exchange: pairs}, execution_strategy)
         aggregator = SignalAggregator(window_size, {"total_market": [p.base for p in pairs]})
-        warmup_signals = warmup_data.apply(aggregator.step, axis=1)
+        warmup_signals = aggregator.step_frame(warmup_data)
         strat = strategy(**kwargs, warmup_signals=warmup_signals, warmup_data=warmup_data)
 
         fair_history = []
@@ -47,7 +47,7 @@ def job(sc, input_path, working_dir):
             execution_strategy = ExecutionStrategy(10, 192, 1, 3, -0.5, 0.002, 0.0005, warmup_data)
             executor = executor(thread_manager, {dummy_exchange: pairs}, execution_strategy)
             aggregator = SignalAggregator(window_size, {"total_market": [p.base for p in pairs]})
-            warmup_signals = warmup_data.apply(aggregator.step, axis=1)
+            warmup_signals = aggregator.step_frame(warmup_data)
             strat = strategy(
                 window_size=window_size,
                 **kwargs,
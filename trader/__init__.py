@@ -7,4 +7,5 @@ from trader.execution_strategy import ExecutionStrategy
 from trader.executor import Executor
 from trader.signal_aggregator import SignalAggregator
 from trader.strategy import Strategy
+from trader.supply import FileSupplySource, SupplyProvider
 from trader.usd_converter import UsdConverter
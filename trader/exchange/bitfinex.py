@@ -6,6 +6,7 @@ from collections import defaultdict
 from copy import deepcopy
 from datetime import datetime
 from queue import Queue
+from threading import Lock
 
 import numpy as np
 import pandas as pd
@@ -16,6 +17,8 @@ from trader.exchange.base import Exchange, ExchangeError
 from trader.util import Feed, Log
 from trader.util.constants import (BITFINEX, BTC, BTC_USD, ETH, ETH_USD, USD,
                                    XRP, XRP_USD)
+from trader.util.thread import ThreadManager
+from trader.util.trace import TRACER
 from trader.util.types import (BookLevel, Currency, ExchangePair, OpenOrder,
                                Order, OrderBook, Side, TradingPair)
 
@@ -43,6 +46,11 @@ class Bitfinex(Exchange):
         self.__api_key = keys["key"]
         self.__api_secret = keys["secret"]
         self.__bfxv1 = ClientV1(self.__api_key, self.__api_secret, 2.0)
+        # Bitfinex rejects any nonce not above the last one it has seen for the key, so every
+        # authenticated request, including the client's own, takes its nonce from one counter.
+        self.__nonce = 0
+        self.__nonce_lock = Lock()
+        self.__bfxv1._nonce = lambda: str(self.__next_nonce())
         self.__bfxv2 = ClientV2(self.__api_key, self.__api_secret)
         self.__ws_client = WssClient(self.__api_key, self.__api_secret)
         self.__ws_client.authenticate(lambda x: None)
@@ -58,7 +66,11 @@ class Bitfinex(Exchange):
         self.__trade_feeds = {}
         self.__positions_queue = Queue()
         self.__positions_feed = self.positions_feed()
-        thread_manager.attach("bitfinex-positions-queue", self.__track_positions)
+        thread_manager.attach(
+            "bitfinex-positions-queue",
+            self.__track_positions,
+            restart=ThreadManager.RestartPolicy(backoff=3),
+        )
         # TODO: Can this be dynamically loaded? (For other exchanges too.)
         self.__fees = {"maker": 0.001, "taker": 0.002}
         # TODO: Maybe start this in a lazy way?
@@ -100,8 +112,11 @@ class Bitfinex(Exchange):
     def __generate_book_feed(self, pair):
         msg_queue = Queue()
 
+        # Messages are queued with their time of receipt, for latency tracing.
         self.__ws_client.subscribe_to_orderbook(
-            Bitfinex.encode_trading_pair(pair), precision="P0", callback=msg_queue.put
+            Bitfinex.encode_trading_pair(pair),
+            precision="P0",
+            callback=lambda msg: msg_queue.put((time.monotonic(), msg)),
         )
 
         order_book = OrderBook(ExchangePair(self.id, pair))
@@ -112,7 +127,7 @@ class Bitfinex(Exchange):
             order_book.update(side, BookLevel(update[0], size))
 
         while True:
-            msg = msg_queue.get()
+            received_at, msg = msg_queue.get()
             # Ignore status/subscription dicts, heartbeats
             if not isinstance(msg, list) or msg[1] == "hb":
                 continue
@@ -123,6 +138,8 @@ class Bitfinex(Exchange):
                     handle_update(order_book, update)
             else:
                 handle_update(order_book, msg[1])
+            order_book.mark_received(received_at)
+            TRACER.record("book_update", order_book.top.published_at - received_at)
             yield order_book
 
     def __generate_trade_feed(self, pair):
@@ -167,7 +184,7 @@ class Bitfinex(Exchange):
             self.__positions_queue.put(deepcopy(positions))
 
         def on_open(ws):
-            nonce = int(time.time() * 1000000)
+            nonce = self.__next_nonce()
             auth_payload = "AUTH{}".format(nonce)
             signature = hmac.new(
                 self.__api_secret.encode(), msg=auth_payload.encode(), digestmod=hashlib.sha384
@@ -216,12 +233,9 @@ class Bitfinex(Exchange):
         def on_error(ws, error):
             Log.warn("WS error within __track_positions for exchange {}: {}".format(self.id, error))
 
-        # TODO: refactor to not be recursive (bc of stack growth)
+        # Returning from `run_forever` ends the thread, which the thread manager then restarts.
         def on_close(ws):
             Log.warn("WS closed unexpectedly for exchange {}".format(self.id))
-            Log.info("restarting WS for exchange {}".format(self.id))
-            time.sleep(3)
-            self.__track_positions()
 
         ws = WebSocketApp(
             "wss://api.bitfinex.com/ws/",
@@ -278,26 +292,42 @@ class Bitfinex(Exchange):
         # TODO: also set last trade prices?
         return prepped
 
+    def __next_nonce(self):
+        """Issues strictly increasing nonces, in microseconds since the epoch where possible."""
+        with self.__nonce_lock:
+            self.__nonce = max(self.__nonce + 1, int(time.time() * 1000000))
+            return self.__nonce
+
     def add_order(self, order):
         assert order.exchange_id == self.id
-        payload = {
-            "request": "/v1/order/new",
-            "nonce": self.__bfxv1._nonce(),
-            # Bitfinex v1 API expects "BTCUSD", v2 API expects "tBTCUSD":
-            "symbol": Bitfinex.encode_trading_pair(order.pair)[1:],
-            "amount": str(order.size),
-            "price": str(order.price),
-            "exchange": "bitfinex",
-            "side": order.side.name.lower(),
-            "type": self.__order_types[order.order_type],
-            "is_postonly": order.maker_only,
-        }
-        try:
-            response = self.__bfxv1._post("/order/new", payload=payload, verify=True)
-        except TypeError as err:
-            Log.warn("Bitfinex _post type error: {}".format(err))
-        except Exception as err:
-            Log.warn("Swallowing unexpected error: {}".format(err))
+        # Orders may be sent concurrently, so an order can still reach Bitfinex after a request
+        # with a higher nonce. It is then resent with a fresh nonce.
+        for _ in range(3):
+            payload = {
+                "request": "/v1/order/new",
+                "nonce": str(self.__next_nonce()),
+                # Bitfinex v1 API expects "BTCUSD", v2 API expects "tBTCUSD":
+                "symbol": Bitfinex.encode_trading_pair(order.pair)[1:],
+                "amount": str(order.size),
+                "price": str(order.price),
+                "exchange": "bitfinex",
+                "side": order.side.name.lower(),
+                "type": self.__order_types[order.order_type],
+                "is_postonly": order.maker_only,
+            }
+            try:
+                response = self.__bfxv1._post("/order/new", payload=payload, verify=True)
+            except TypeError as err:
+                Log.warn("Bitfinex _post type error: {}".format(err))
+                return None
+            except Exception as err:
+                Log.warn("Swallowing unexpected error: {}".format(err))
+                return None
+            if "nonce" not in str(response.get("message", "")).lower():
+                break
+            Log.debug("Bitfinex-nonce-retry", response)
+        else:
+            Log.warn("Bitfinex-order-dropped", {"order": order, "response": response})
             return None
         Log.debug("Bitfinex-order-response", response)
         if "id" in response:
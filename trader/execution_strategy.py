@@ -1,7 +1,41 @@
 import numpy as np
+import pandas as pd
 
 from trader.util import Log
-from trader.util.stats import HoltEma, TrendEstimator
+from trader.util.stats import EstimatorBank, HoltEma, TrendEstimator
+
+
+def _order_sizes(size, positions, bids, asks, means, stddevs, fees, micro_trend, trend, edge_trend):
+    """Computes order sizes from quotes, fairs and trends, given as aligned Series or arrays."""
+    mids = (bids + asks) / 2
+    prices = (means >= mids) * asks + (means < mids) * bids
+
+    z_edge = (means - prices) / stddevs
+    pct_edge = means / prices - 1
+    direction = np.sign(pct_edge)
+    net_pct_edge = direction * np.maximum(0, np.abs(pct_edge) - 2 * fees)
+    target_position_values = direction * np.sqrt(z_edge * net_pct_edge * 100) * size
+    proposed_orders = target_position_values / means - positions
+    profitable = np.sign(proposed_orders) * pct_edge > 2 * fees
+    profitable_orders = proposed_orders * profitable
+
+    unprofitable_position = np.sign(positions) * pct_edge < 0
+    position_closing_orders = -positions * (profitable_orders == 0) * unprofitable_position
+
+    trending_correctly = (trend * direction > 0) & (micro_trend * direction > 0)
+    reverting = edge_trend * direction < 0
+
+    return (profitable_orders + position_closing_orders) * trending_correctly * reverting
+
+
+def _warn_if_cold(ready):
+    if not ready:
+        Log.warn(
+            "Execution strategy initialized but had insufficient warmup data. Will \
+            warm up slowly in real time."
+        )
+    else:
+        Log.info("Execution strategy initialized and warm.")
 
 
 class ExecutionStrategy:
@@ -25,18 +59,11 @@ class ExecutionStrategy:
             HoltEma(micro_trend_hl, micro_accel_hl), latest_prices
         )
         self.trend_estimator = TrendEstimator(HoltEma(trend_hl, accel_hl), latest_prices)
-        for _, prices in warmup_prices.iloc[-4 * accel_hl :].iterrows():
-            self.micro_trend_estimator.step(prices)
-            self.trend_estimator.step(prices)
+        self.micro_trend_estimator.step_many(warmup_prices.iloc[-4 * accel_hl :])
+        self.trend_estimator.step_many(warmup_prices.iloc[-4 * accel_hl :])
         self.edge_trend_estimator = TrendEstimator(HoltEma(edge_trend_hl, edge_accel_hl))
 
-        if not self.trend_estimator.ready:
-            Log.warn(
-                "Execution strategy initialized but had insufficient warmup data. Will \
-                warm up slowly in real time."
-            )
-        else:
-            Log.info("Execution strategy initialized and warm.")
+        _warn_if_cold(self.trend_estimator.ready)
 
     def tick(self, positions, bids, asks, fairs, fees):
         """Takes fair as Gaussian, positions in base currency.
@@ -51,29 +78,137 @@ class ExecutionStrategy:
         TODO: use books instead of just the best bid/ask price
         """
         mids = (bids + asks) / 2  # Use mid price for target position value calculations.
-        prices = (fairs.mean >= mids) * asks + (fairs.mean < mids) * bids
-
         micro_trend = self.micro_trend_estimator.step(mids)
         trend = self.trend_estimator.step(mids)
         edge_trend = self.edge_trend_estimator.step(fairs.mean / mids - 1)
 
-        z_edge = (fairs.mean - prices) / fairs.stddev
-        pct_edge = fairs.mean / prices - 1
-        net_pct_edge = np.sign(pct_edge) * np.maximum(0, np.abs(pct_edge) - 2 * fees)
-        target_position_values = (
-            np.sign(pct_edge) * np.sqrt(z_edge * net_pct_edge * 100) * self.size
+        pair_positions = pd.Series(
+            positions[[(ep.exchange_id, ep.base) for ep in mids.index]].values, index=mids.index
         )
-        pair_positions = positions[[(ep.exchange_id, ep.base) for ep in mids.index]].set_axis(
-            mids.index, inplace=False
+        return _order_sizes(
+            self.size,
+            pair_positions,
+            bids,
+            asks,
+            fairs.mean,
+            fairs.stddev,
+            fees,
+            micro_trend,
+            trend,
+            edge_trend,
         )
-        proposed_orders = target_position_values / fairs.mean - pair_positions
-        profitable = np.sign(proposed_orders) * pct_edge > 2 * fees
-        profitable_orders = proposed_orders * profitable
 
-        unprofitable_position = np.sign(pair_positions) * pct_edge < 0
-        position_closing_orders = -pair_positions * (profitable_orders == 0) * unprofitable_position
 
-        trending_correctly = (trend * np.sign(pct_edge) > 0) & (micro_trend * np.sign(pct_edge) > 0)
-        reverting = edge_trend * np.sign(pct_edge) < 0
+class CompiledExecutionStrategy:
+    """An `ExecutionStrategy` on plain arrays, for a pair ordering fixed at construction.
 
-        return (profitable_orders + position_closing_orders) * trending_correctly * reverting
+    Every argument of `tick` is an (N,) array aligned to `exchange_pairs`, so a tick does no label
+    alignment. The micro and long trends share one `EstimatorBank`, and both are warmed up in a
+    single bulk pass over `warmup_data`. Given the same inputs it returns the same order sizes as
+    `ExecutionStrategy.tick`.
+
+    Args:
+        exchange_pairs (list): The ordering of every array in and out of `tick`.
+        size, micro_trend_hl, micro_accel_hl, trend_hl, accel_hl, edge_trend_hl, edge_accel_hl,
+            warmup_data: As for `ExecutionStrategy`.
+
+    """
+
+    def __init__(
+        self,
+        exchange_pairs,
+        size,
+        micro_trend_hl,
+        micro_accel_hl,
+        trend_hl,
+        accel_hl,
+        edge_trend_hl,
+        edge_accel_hl,
+        warmup_data,
+    ):
+        self.__exchange_pairs = list(exchange_pairs)
+        self.size = size
+        n = len(self.__exchange_pairs)
+
+        warmup_prices = warmup_data.xs("price", axis=1, level=1)[self.__exchange_pairs].values
+        self.__trends = EstimatorBank(
+            [(micro_trend_hl, micro_accel_hl), (trend_hl, accel_hl)],
+            n,
+            differenced=True,
+            init=warmup_prices[-1],
+        )
+        self.__trends.step_many(warmup_prices[-4 * accel_hl :])
+        self.__edge_trend = EstimatorBank([(edge_trend_hl, edge_accel_hl)], n, differenced=True)
+
+        _warn_if_cold(self.__trends[1].ready)
+
+    @property
+    def exchange_pairs(self):
+        return self.__exchange_pairs
+
+    def tick(self, positions, bids, asks, fair_means, fair_stddevs, fees):
+        """Takes (N,) arrays aligned to `exchange_pairs`, with positions in each pair's base
+        currency. Returns an (N,) array of orders in base currency (negative size indicates sell).
+        """
+        mids = (bids + asks) / 2
+        micro_trend, trend = self.__trends.step(mids)
+        (edge_trend,) = self.__edge_trend.step(fair_means / mids - 1)
+        return _order_sizes(
+            self.size,
+            positions,
+            bids,
+            asks,
+            fair_means,
+            fair_stddevs,
+            fees,
+            micro_trend,
+            trend,
+            edge_trend,
+        )
+
+
+def test_compiled_execution_strategy():
+    """Tests that the compiled strategy matches `ExecutionStrategy` tick for tick."""
+    from trader.util import Gaussian
+    from trader.util.constants import BTC, BTC_USD, ETH, ETH_USD, XRP, XRP_USD
+    from trader.util.types import ExchangePair
+
+    rng = np.random.RandomState(3)
+    exchange_pairs = [ExchangePair("bitfinex", p) for p in [BTC_USD, ETH_USD, XRP_USD]]
+    base_prices = np.array([8000, 200, 0.3])
+    prices = base_prices * np.exp(rng.randn(300, 3).cumsum(axis=0) * 1e-3)
+    columns = pd.MultiIndex.from_product([exchange_pairs, ["price", "volume"]])
+    values = np.stack([prices, np.ones_like(prices)], axis=2).reshape(len(prices), -1)
+    warmup_data = pd.DataFrame(values[:200], columns=columns)
+
+    params = (10, 1, 3, 4, 12, 2, 6, warmup_data)
+    strategy = ExecutionStrategy(*params)
+    # Compiled in a different order than the Series are labelled.
+    order = [2, 0, 1]
+    compiled = CompiledExecutionStrategy([exchange_pairs[i] for i in order], *params)
+    fees = np.full(3, 0.001)
+
+    traded = 0
+    positions = pd.Series(0.0, index=pd.MultiIndex.from_product([["bitfinex"], [BTC, ETH, XRP]]))
+    for mid in prices[200:]:
+        spread = mid * 2e-4
+        means = mid * (1 + rng.randn(3) * 1e-2)
+        stddevs = mid * 1e-3
+        fairs = Gaussian(pd.Series(means, index=exchange_pairs), np.diag(stddevs ** 2))
+        bids = pd.Series(mid - spread, index=exchange_pairs)
+        asks = pd.Series(mid + spread, index=exchange_pairs)
+
+        fee_series = pd.Series(fees, index=exchange_pairs)
+        expected = strategy.tick(positions, bids, asks, fairs, fee_series)
+        actual = compiled.tick(
+            positions.values[order],
+            bids.values[order],
+            asks.values[order],
+            means[order],
+            stddevs[order],
+            fees[order],
+        )
+        np.testing.assert_allclose(actual, expected.values[order])
+        positions += expected.fillna(0).values
+        traded += np.count_nonzero(expected.fillna(0))
+    assert traded > 0
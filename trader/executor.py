@@ -1,18 +1,40 @@
-from copy import deepcopy
-from threading import Lock
+import time
+from collections import deque
 
 import pandas as pd
 
-from trader.util import Log
+from trader.top_of_book import TopOfBookRegistry
+from trader.util import Feed, Log
+from trader.util.thread import MVar
+from trader.util.trace import TRACER
 from trader.util.types import ExchangePair, Order, Side
 
 
 class Executor:
     """Given fair updates, listens to book updates and places orders to optimize our portfolio.
 
-    NOTE: We lock `__trade` by exchange/pair such that calls to it are skipped if a lock cannot
-    be acquired. However, this only applies to order ticks (new fairs prices should always run a
-    cycle of orders).
+    Book updates are published to a `TopOfBookRegistry`, and each trade cycle reads one consistent
+    snapshot of it. Trading happens on a single long-lived worker thread that waits on a one-slot
+    mailbox of fairs. Fairs that arrive while the worker is busy overwrite any fairs it has not
+    picked up yet, so it always trades on the latest fairs and book snapshot, and
+    `fairs_coalesced` counts the skipped updates.
+
+    Setting `book_threshold` also re-runs the execution strategy against the latest fairs whenever a
+    book update moves a pair's best bid or ask by more than that fraction since the pair was last
+    evaluated. A triggered re-evaluation waits out `book_debounce` seconds in the mailbox, so the
+    triggers of a burst of book updates across pairs find it full and collapse into one cycle. Each
+    pair triggers at most `book_max_rate` times a second, and a trigger never displaces fairs that
+    are waiting to be traded on.
+
+    The orders of a cycle are sent in parallel on the thread manager's bounded worker pool, since
+    `add_order` blocks on a network round trip. The cycle waits for every order, so the last order
+    goes out after roughly the slowest round trip rather than the sum of them.
+
+    Every cycle is traced on `TRACER` with the hops `mailbox` (or `debounce` for book triggers),
+    `execution` and `decision`, and every order with `order_send` and `order_ack`. The trace of a
+    triggered cycle starts when the triggering book was received, and goes through `book_update`
+    and `book_trigger` first. `order_total` records the time from the start of a cycle's trace to
+    the acknowledgement of each of its orders.
 
     Args:
         thread_manager (ThreadManager): A thread manager to attach any child threads for this
@@ -20,12 +42,34 @@ class Executor:
         exchanges_and_pairs (dict): A dictionary indexed by exchange, consisting of the pairs from
             that exchange to execute on.
         execution_strategy (ExecutionStrategy)
+        book_threshold (float): Relative top-of-book move that triggers a re-evaluation, or None
+            to only trade on new fairs.
+        book_debounce (float): Seconds to wait after a book trigger before re-evaluating.
+        book_max_rate (float): Maximum book triggers per second for each pair.
 
     """
 
-    def __init__(self, thread_manager, exchanges_and_pairs, execution_strategy):
-        self.__trade_lock = Lock()
-        self.__books_lock = Lock()
+    def __init__(
+        self,
+        thread_manager,
+        exchanges_and_pairs,
+        execution_strategy,
+        book_threshold=None,
+        book_debounce=0.05,
+        book_max_rate=1.0,
+    ):
+        # Holds (fairs, book trigger time, trace id), where the time is None for new fairs.
+        self.__fairs_mailbox = MVar()
+        self.__fairs_coalesced = 0
+        self.__fairs_processed = 0
+        self.__book_threshold = book_threshold
+        self.__book_debounce = book_debounce
+        self.__book_trigger_interval = 1 / book_max_rate
+        self.__book_reevaluations = 0
+        self.__last_book_triggers = {}
+        self.__evaluated_tops = {}
+        self.__order_latencies = deque(maxlen=1000)
+        self.__last_open_orders = []
         self.__latest_fairs = None
         self.__thread_manager = thread_manager
         self.__exchange_pairs = [
@@ -33,59 +77,127 @@ class Executor:
         ]
         self.__exchanges = {e.id: e for e in exchanges_and_pairs}
         self.__order_id_counter = 0
-        self.__latest_books = {ep: None for ep in self.__exchange_pairs}
+        self.__books = TopOfBookRegistry(self.__exchange_pairs)
         self.execution_strategy = execution_strategy
 
-        # Set up book feeds for every pair.
+        # Set up book feeds for every pair. Only the latest book matters, so a slow reader skips
+        # intermediate books rather than falling behind.
         for ep in self.__exchange_pairs:
+            book_feed = self.__exchanges[ep.exchange_id].book_feed(ep.pair)
             thread_manager.attach(
                 "executor-{}".format(ep),
-                self.__exchanges[ep.exchange_id].book_feed(ep.pair).subscribe(self.__tick_book),
+                book_feed.subscribe(self.__tick_book, backpressure=Feed.Backpressure.CONFLATE),
             )
+        thread_manager.attach("executor-trade", self.__run_trades)
+
+    @property
+    def fairs_coalesced(self):
+        """The number of fair updates overwritten by newer fairs before they were traded on."""
+        return self.__fairs_coalesced
+
+    @property
+    def fairs_processed(self):
+        """The number of fair updates traded on."""
+        return self.__fairs_processed
+
+    @property
+    def book_reevaluations(self):
+        """The number of trade cycles triggered by book updates."""
+        return self.__book_reevaluations
+
+    @property
+    def order_latencies(self):
+        """Seconds taken by `add_order` for up to the last 1000 orders, oldest first."""
+        return list(self.__order_latencies)
+
+    @property
+    def last_open_orders(self):
+        """The `OpenOrder`s returned by the exchanges in the latest trade cycle."""
+        return self.__last_open_orders
 
     def __tick_book(self, book):
-        self.__books_lock.acquire()
-        self.__latest_books[book.exchange_pair] = book
-        # Log.warn("new book", book.exchange_pair)
-        self.__books_lock.release()
+        # Read the top once; the book itself may be mutated by the exchange's feed thread.
+        top = book.top
+        self.__books.publish(book.exchange_pair, top)
+        if self.__book_threshold is not None:
+            self.__check_book_trigger(book.exchange_pair, top)
 
-    def __trade(self, wait_for_other_trade=False):
+    def __check_book_trigger(self, ep, top):
+        fairs = self.__latest_fairs
+        evaluated_top = self.__evaluated_tops.get(ep)
+        if fairs is None or evaluated_top is None:
+            return
+        evaluated_bid, evaluated_ask = evaluated_top
+        move = max(abs(top.bid / evaluated_bid - 1), abs(top.ask / evaluated_ask - 1))
+        # Also skips NaN moves, from books with an empty side.
+        if not move > self.__book_threshold:
+            return
+        now = time.monotonic()
+        if now - self.__last_book_triggers.get(ep, -float("inf")) < self.__book_trigger_interval:
+            return
+        # The cycle's trace starts from the receipt of the book, whose `book_update` hop is
+        # recorded by the exchange for every update.
+        trace_id = TRACER.start(at=top.received_at)
+        if top.received_at is not None:
+            TRACER.stamp(trace_id, "book_update", at=top.published_at, record=False)
+        TRACER.stamp(trace_id, "book_trigger", at=now)
+        if self.__fairs_mailbox.try_put((fairs, now, trace_id)):
+            self.__last_book_triggers[ep] = now
+            Log.debug("book trigger {} {}".format(ep, move))
+        else:
+            TRACER.finish(trace_id)
+
+    def __run_trades(self):
+        while True:
+            _, triggered_at, _ = self.__fairs_mailbox.read()
+            if triggered_at is not None:
+                # Debounce with the trigger still in the mailbox, so that triggers from other pairs
+                # fail to get in rather than each running a cycle of their own. New fairs may still
+                # replace it, and are then traded on instead.
+                time.sleep(max(0, triggered_at + self.__book_debounce - time.monotonic()))
+            fairs, triggered_at, trace_id = self.__fairs_mailbox.take()
+            TRACER.stamp(trace_id, "mailbox" if triggered_at is None else "debounce")
+            self.__latest_fairs = fairs
+            self.__trade(trace_id)
+            TRACER.finish(trace_id)
+            if triggered_at is None:
+                self.__fairs_processed += 1
+            else:
+                self.__book_reevaluations += 1
+
+    def __trade(self, trace_id):
         """
-        If `wait_for_other_trade` is false, doesn't try to trade if there is another thread
-        attempting to trade. If true, it will wait for the other thread to finish and try
-        immediately after.
-        TODO: requires that __latest_fairs and self.__exchange_pairs have the same indexing. Make
-        this explicit or don't require it.
+        Runs one cycle of orders against the latest fairs and books. Only called from the trade
+        worker, so cycles never overlap. Fairs may be indexed by any of this executor's exchange
+        pairs, in any order.
         """
         if self.__latest_fairs is None:
             Log.warn("Attempted to trade but executor has not received any fairs.")
             return
 
+        books = self.__books.snapshot()
+        fair_pairs = self.__latest_fairs.mean.index
+        unknown_pairs = fair_pairs.difference(books.exchange_pairs)
+        if len(unknown_pairs) > 0:
+            Log.warn("Attempted to trade on exchange pairs without books:", list(unknown_pairs))
+            return
+        rows = books.positions(fair_pairs)
+
         # component warmup may not be synchronized
-        for ep in self.__latest_fairs.mean.index:
-            if not ep in self.__latest_books:
+        for ep, seq in zip(fair_pairs, books.seqs[rows]):
+            if seq == 0:
                 Log.warn("Attempted to trade but executor has no book data for exchange pair:", ep)
                 return
 
-        if wait_for_other_trade:
-            self.__trade_lock.acquire()
-        elif not self.__trade_lock.acquire(blocking=False):
-            Log.debug("Other thread trading.")
-            return
-
-        bids = pd.Series(index=self.__latest_fairs.mean.index)
-        asks = pd.Series(index=self.__latest_fairs.mean.index)
-        fees = pd.Series(index=self.__latest_fairs.mean.index)
+        bids = pd.Series(books.bids[rows], index=fair_pairs)
+        asks = pd.Series(books.asks[rows], index=fair_pairs)
+        fees = pd.Series(index=fair_pairs)
         positions = {}
-        # self.__books_lock.acquire()
-        for exchange_pair in self.__latest_fairs.mean.index:
+        for exchange_pair in fair_pairs:
             exchange = self.__exchanges[exchange_pair.exchange_id]
-            book = self.__latest_books[exchange_pair]
-            bids[exchange_pair] = book.bids[0].price
-            asks[exchange_pair] = book.asks[0].price
             fees[exchange_pair] = exchange.fees["taker"]
+            self.__evaluated_tops[exchange_pair] = (bids[exchange_pair], asks[exchange_pair])
             positions[exchange.id, exchange_pair.base] = exchange.positions[exchange_pair.base] or 0
-        # self.__books_lock.release()
         positions = pd.Series(positions)
         Log.info("Positions", positions)
 
@@ -93,24 +205,456 @@ class Executor:
             positions, bids, asks, self.__latest_fairs, fees
         ).fillna(0.0)
         Log.debug("Order size", order_sizes)
+        TRACER.stamp(trace_id, "execution")
 
+        orders = []
         for exchange_pair, order_size in order_sizes.items():
             if order_size == 0:
                 continue
-            exchange = self.__exchanges[exchange_pair.exchange_id]
             side = Side.BUY if order_size > 0 else Side.SELL
             price = (asks if order_size > 0 else bids)[exchange_pair]
             order = Order(
                 self.__next_order_id(), exchange_pair, side, Order.Type.IOC, price, abs(order_size)
             )
-            exchange.add_order(order)  # TODO: require this to be async?
-            Log.info("sent order", order)
-        self.__trade_lock.release()
+            orders.append(order)
+        TRACER.stamp(trace_id, "decision")
+
+        dispatches = [
+            self.__thread_manager.submit(self.__send_order, order, TRACER.fork(trace_id))
+            for order in orders
+        ]
+        open_orders = []
+        for order, dispatch in zip(orders, dispatches):
+            try:
+                open_order = dispatch.result()
+            except Exception as err:
+                Log.warn("Failed to send order {}: {}".format(order, err))
+                continue
+            if open_order is not None:
+                open_orders.append(open_order)
+        self.__last_open_orders = open_orders
 
-    def tick_fairs(self, fairs):
-        self.__latest_fairs = fairs
-        self.__thread_manager.attach("executor-fairs", self.__trade, should_terminate=True)
+    def __send_order(self, order, trace_id):
+        exchange = self.__exchanges[order.exchange_id]
+        start = time.monotonic()
+        TRACER.stamp(trace_id, "order_send", at=start)
+        try:
+            open_order = exchange.add_order(order)
+        finally:
+            acked_at = time.monotonic()
+            TRACER.stamp(trace_id, "order_ack", at=acked_at)
+            TRACER.finish(trace_id, "order_total", at=acked_at)
+        latency = acked_at - start
+        self.__order_latencies.append(latency)
+        Log.info("sent order", (order, latency))
+        return open_order
+
+    def tick_fairs(self, fairs, trace_id=None):
+        """Hands new fairs to the trade worker, replacing any fairs it has not picked up yet.
+
+        Args:
+            fairs (Gaussian): The new fairs.
+            trace_id (int): The `TRACER` trace the fairs were computed on. Starts a new trace if
+                None.
+
+        """
+        if trace_id is None:
+            trace_id = TRACER.start()
+        replaced = self.__fairs_mailbox.swap((fairs, None, trace_id))
+        if replaced is not None:
+            TRACER.finish(replaced[2])
+            if replaced[1] is None:
+                self.__fairs_coalesced += 1
 
     def __next_order_id(self):
         self.__order_id_counter += 1
         return self.__order_id_counter
+
+
+def _stub_exchange(thread_manager, pairs, order_delay=0):
+    """An exchange for tests, whose books are pushed by hand and whose orders take `order_delay`
+    seconds to send."""
+    from queue import Queue
+    from threading import current_thread
+
+    from trader.exchange.base import Exchange
+    from trader.util import Feed
+    from trader.util.types import BookLevel, OpenOrder, OrderBook
+
+    class StubExchange(Exchange):
+        id = "stub"
+        positions = None
+        fees = {"maker": 0, "taker": 0}
+        encode_trading_pair = decode_trading_pair = staticmethod(lambda _: None)
+        frame = positions_feed = cancel_order = get_open_positions = get_warmup_data = None
+
+        def __init__(self):
+            super().__init__(thread_manager)
+            self.positions = {p.base: 0.0 for p in pairs}
+            self.sent_orders = []
+            self.order_threads = []
+            self.book_queues = {p: Queue() for p in pairs}
+            self.__book_feeds = {}
+            for pair in pairs:
+                self.__book_feeds[pair], runner = Feed.of(iter(self.book_queues[pair].get, None))
+                thread_manager.attach("stub-{}-book".format(pair), runner)
+
+        def book_feed(self, pair):
+            return self.__book_feeds[pair]
+
+        def push_book(self, pair, bid, ask, received_at=None):
+            """Pushes a book with one level on each side, or an empty side for a price of None."""
+            ep = ExchangePair(self.id, pair)
+            bids = [] if bid is None else [BookLevel(bid, 1)]
+            asks = [] if ask is None else [BookLevel(ask, 1)]
+            self.book_queues[pair].put(OrderBook(ep, bids, asks, received_at))
+
+        def add_order(self, order):
+            time.sleep(order_delay)
+            self.sent_orders.append(order)
+            self.order_threads.append(current_thread().name)
+            return OpenOrder(order, order.id)
+
+    return StubExchange()
+
+
+def test_executor_coalesces_fairs():
+    """Tests that fairs arriving during a trade are coalesced into one trade on the latest fairs."""
+    from threading import Event
+
+    from trader.util import Gaussian
+    from trader.util.constants import BTC_USD, ETH_USD
+    from trader.util.thread import ThreadManager
+
+    pairs = [BTC_USD, ETH_USD]
+    exchange_pairs = [ExchangePair("stub", p) for p in pairs]
+
+    class StubStrategy:
+        def __init__(self):
+            self.seen = []
+            self.entered = Event()
+            self.release = Event()
+
+        def tick(self, positions, bids, asks, fairs, fees):
+            self.seen.append(fairs.mean.iloc[0])
+            self.entered.set()
+            self.release.wait()
+            return fairs.mean
+
+    def fairs(value):
+        return Gaussian(pd.Series(value, index=exchange_pairs), [1.0, 1.0])
+
+    thread_manager = ThreadManager()
+    strategy = StubStrategy()
+    exchange = _stub_exchange(thread_manager, pairs)
+    executor = Executor(thread_manager, {exchange: pairs}, strategy)
+
+    def main():
+        for pair in pairs:
+            exchange.push_book(pair, 99, 101)
+        # Retry until the books have reached the executor and the first trade is blocked.
+        ticks = 0
+        while not strategy.entered.wait(0.05):
+            executor.tick_fairs(fairs(1.0))
+            ticks += 1
+        processed = executor.fairs_processed
+        executor.tick_fairs(fairs(2.0))
+        executor.tick_fairs(fairs(3.0))
+        strategy.release.set()
+        while executor.fairs_processed < processed + 2:
+            time.sleep(0.01)
+
+        # Every update is either traded on or coalesced, and 2.0 is always coalesced.
+        assert strategy.seen == [1.0, 3.0]
+        assert executor.fairs_processed + executor.fairs_coalesced == ticks + 2
+        assert [o.size for o in exchange.sent_orders] == [1.0, 1.0, 3.0, 3.0]
+
+    thread_manager.attach("main", main, should_terminate=True)
+    thread_manager.run()
+
+
+def test_executor_book_trigger():
+    """Tests that large top-of-book moves re-run the strategy, subject to the per-pair rate."""
+    from trader.util import Gaussian
+    from trader.util.constants import BTC_USD, ETH_USD
+    from trader.util.thread import ThreadManager
+
+    pairs = [BTC_USD, ETH_USD]
+    exchange_pairs = [ExchangePair("stub", p) for p in pairs]
+
+    class StubStrategy:
+        def __init__(self):
+            self.seen_bids = []
+
+        def tick(self, positions, bids, asks, fairs, fees):
+            self.seen_bids.append(bids.iloc[0])
+            return fairs.mean * 0
+
+    thread_manager = ThreadManager()
+    strategy = StubStrategy()
+    exchange = _stub_exchange(thread_manager, pairs)
+    executor = Executor(
+        thread_manager,
+        {exchange: pairs},
+        strategy,
+        book_threshold=0.01,
+        book_debounce=0.01,
+        book_max_rate=2.0,
+    )
+
+    def wait_for_books():
+        time.sleep(0.1)
+
+    def main():
+        for pair in pairs:
+            exchange.push_book(pair, 99, 101)
+        while not strategy.seen_bids:
+            executor.tick_fairs(Gaussian(pd.Series(100.0, index=exchange_pairs), [1.0, 1.0]))
+            wait_for_books()
+
+        exchange.push_book(BTC_USD, 98.5, 101)
+        wait_for_books()
+        assert executor.book_reevaluations == 0
+
+        exchange.push_book(BTC_USD, 95, 101)
+        wait_for_books()
+        assert executor.book_reevaluations == 1
+        assert strategy.seen_bids[-1] == 95
+
+        # Within half a second of the last trigger, BTC is rate limited.
+        exchange.push_book(BTC_USD, 90, 101)
+        wait_for_books()
+        assert executor.book_reevaluations == 1
+        time.sleep(0.4)
+        exchange.push_book(BTC_USD, 85, 101)
+        wait_for_books()
+        assert executor.book_reevaluations == 2
+        assert strategy.seen_bids[-1] == 85
+
+    thread_manager.attach("main", main, should_terminate=True)
+    thread_manager.run()
+
+
+def test_executor_dispatches_concurrently():
+    """Tests that the orders of one cycle are sent in parallel and their results collected."""
+    from trader.util import Gaussian
+    from trader.util.constants import BTC_USD, ETH_USD, LTC_USD, XRP_USD
+    from trader.util.thread import ThreadManager
+
+    pairs = [BTC_USD, ETH_USD, LTC_USD, XRP_USD]
+    exchange_pairs = [ExchangePair("stub", p) for p in pairs]
+
+    class StubStrategy:
+        def tick(self, positions, bids, asks, fairs, fees):
+            return fairs.mean
+
+    thread_manager = ThreadManager()
+    exchange = _stub_exchange(thread_manager, pairs, order_delay=0.2)
+    executor = Executor(thread_manager, {exchange: pairs}, StubStrategy())
+
+    def main():
+        for pair in pairs:
+            exchange.push_book(pair, 99, 101)
+        fairs = Gaussian(pd.Series(1.0, index=exchange_pairs), [1.0] * len(pairs))
+        while not executor.last_open_orders:
+            processed = executor.fairs_processed
+            start = time.monotonic()
+            executor.tick_fairs(fairs)
+            while executor.fairs_processed == processed:
+                time.sleep(0.01)
+            elapsed = time.monotonic() - start
+
+        assert sorted(o.id for o in executor.last_open_orders) == [1, 2, 3, 4]
+        assert len(executor.order_latencies) == 4
+        assert min(executor.order_latencies) >= 0.2
+        assert TRACER.histogram("order_ack").max >= 0.2
+        # Orders go out on the thread manager's worker pool rather than threads of their own.
+        assert all(name.startswith("pool") for name in exchange.order_threads)
+        # Sequential sends would take at least 0.8 seconds.
+        assert elapsed < 0.6
+
+    thread_manager.attach("main", main, should_terminate=True)
+    thread_manager.run()
+
+
+def _wait_until(condition):
+    while not condition():
+        time.sleep(0.01)
+
+
+def test_executor_book_trigger_burst():
+    """Tests that book triggers from several pairs within one debounce window run one cycle."""
+    from trader.util import Gaussian
+    from trader.util.constants import BTC_USD, ETH_USD, XRP_USD
+    from trader.util.thread import ThreadManager
+
+    pairs = [BTC_USD, ETH_USD, XRP_USD]
+    exchange_pairs = [ExchangePair("stub", p) for p in pairs]
+
+    class StubStrategy:
+        def __init__(self):
+            self.seen_bids = []
+
+        def tick(self, positions, bids, asks, fairs, fees):
+            self.seen_bids.append(list(bids))
+            return fairs.mean * 0
+
+    thread_manager = ThreadManager()
+    strategy = StubStrategy()
+    exchange = _stub_exchange(thread_manager, pairs)
+    # The debounce is long enough for every pair's book thread to try to trigger within it.
+    executor = Executor(
+        thread_manager, {exchange: pairs}, strategy, book_threshold=0.01, book_debounce=1.0
+    )
+    fairs = Gaussian(pd.Series(100.0, index=exchange_pairs), [1.0] * len(pairs))
+
+    def flush():
+        processed = executor.fairs_processed
+        executor.tick_fairs(fairs)
+        _wait_until(lambda: executor.fairs_processed > processed)
+
+    def main():
+        for pair in pairs:
+            exchange.push_book(pair, 99, 101)
+        while not strategy.seen_bids or strategy.seen_bids[-1] != [99] * len(pairs):
+            flush()
+
+        for pair in pairs:
+            exchange.push_book(pair, 90, 101)
+        _wait_until(lambda: executor.book_reevaluations > 0)
+        assert strategy.seen_bids[-1] == [90] * len(pairs)
+
+        # No other trigger may have run a cycle before the fairs that flush the mailbox.
+        flush()
+        assert executor.book_reevaluations == 1
+
+    thread_manager.attach("main", main, should_terminate=True)
+    thread_manager.run()
+
+
+def test_executor_book_trigger_empty_side():
+    """Tests that a book with an empty side does not trigger a re-evaluation."""
+    import math
+
+    from trader.util import Gaussian
+    from trader.util.constants import BTC_USD, ETH_USD
+    from trader.util.thread import ThreadManager
+
+    pairs = [BTC_USD, ETH_USD]
+    exchange_pairs = [ExchangePair("stub", p) for p in pairs]
+
+    class StubStrategy:
+        def __init__(self):
+            self.seen_bids = []
+
+        def tick(self, positions, bids, asks, fairs, fees):
+            self.seen_bids.append(list(bids))
+            return fairs.mean * 0
+
+    thread_manager = ThreadManager()
+    strategy = StubStrategy()
+    exchange = _stub_exchange(thread_manager, pairs)
+    executor = Executor(
+        thread_manager, {exchange: pairs}, strategy, book_threshold=0.01, book_debounce=0
+    )
+    fairs = Gaussian(pd.Series(100.0, index=exchange_pairs), [1.0] * len(pairs))
+
+    def flush():
+        processed = executor.fairs_processed
+        executor.tick_fairs(fairs)
+        _wait_until(lambda: executor.fairs_processed > processed)
+
+    def main():
+        for pair in pairs:
+            exchange.push_book(pair, 99, 101)
+        while not strategy.seen_bids or strategy.seen_bids[-1] != [99, 99]:
+            flush()
+
+        exchange.push_book(BTC_USD, None, 101)
+        while not math.isnan(strategy.seen_bids[-1][0]):
+            flush()
+        # The pair was last evaluated with an empty side, so no move can be measured either.
+        exchange.push_book(BTC_USD, 95, 101)
+        while strategy.seen_bids[-1][0] != 95:
+            flush()
+        assert executor.book_reevaluations == 0
+
+    thread_manager.attach("main", main, should_terminate=True)
+    thread_manager.run()
+
+
+def test_executor_unknown_pairs():
+    """Tests that fairs for pairs the executor has no books for are skipped without killing the
+    trade worker."""
+    from trader.util import Gaussian
+    from trader.util.constants import BTC_USD, ETH_USD, LTC_USD
+    from trader.util.thread import ThreadManager
+
+    pairs = [BTC_USD, ETH_USD]
+    exchange_pairs = [ExchangePair("stub", p) for p in pairs]
+
+    class StubStrategy:
+        def tick(self, positions, bids, asks, fairs, fees):
+            return fairs.mean
+
+    thread_manager = ThreadManager()
+    exchange = _stub_exchange(thread_manager, pairs)
+    executor = Executor(thread_manager, {exchange: pairs}, StubStrategy())
+
+    def trade(exchange_pairs):
+        processed = executor.fairs_processed
+        executor.tick_fairs(Gaussian(pd.Series(1.0, index=exchange_pairs), [1.0] * 2))
+        _wait_until(lambda: executor.fairs_processed > processed)
+
+    def main():
+        for pair in pairs:
+            exchange.push_book(pair, 99, 101)
+        trade([exchange_pairs[0], ExchangePair("stub", LTC_USD)])
+        assert exchange.sent_orders == []
+        while not exchange.sent_orders:
+            trade(exchange_pairs)
+        assert thread_manager.is_alive("executor-trade")
+
+    thread_manager.attach("main", main, should_terminate=True)
+    thread_manager.run()
+
+
+def test_executor_book_trigger_trace():
+    """Tests that the trace of a triggered cycle runs from the receipt of the triggering book to
+    the acknowledgement of its orders."""
+    from trader.util import Gaussian
+    from trader.util.constants import BTC_USD, ETH_USD
+    from trader.util.thread import ThreadManager
+
+    pairs = [BTC_USD, ETH_USD]
+    exchange_pairs = [ExchangePair("stub", p) for p in pairs]
+
+    class StubStrategy:
+        def tick(self, positions, bids, asks, fairs, fees):
+            return fairs.mean
+
+    thread_manager = ThreadManager()
+    exchange = _stub_exchange(thread_manager, pairs)
+    executor = Executor(
+        thread_manager, {exchange: pairs}, StubStrategy(), book_threshold=0.01, book_debounce=0
+    )
+    fairs = Gaussian(pd.Series(1.0, index=exchange_pairs), [1.0] * len(pairs))
+
+    def main():
+        for pair in pairs:
+            exchange.push_book(pair, 99, 101)
+        while not exchange.sent_orders:
+            processed = executor.fairs_processed
+            executor.tick_fairs(fairs)
+            _wait_until(lambda: executor.fairs_processed > processed)
+
+        TRACER.reset()
+        exchange.push_book(BTC_USD, 90, 101, received_at=time.monotonic() - 5)
+        _wait_until(lambda: executor.book_reevaluations > 0)
+        # The book's age is in the orders' totals, but not in the hop after the book update.
+        assert TRACER.histogram("book_trigger").max < 1
+        assert TRACER.histogram("order_total").min >= 5
+        assert TRACER.histogram("book_update") is None
+
+    thread_manager.attach("main", main, should_terminate=True)
+    thread_manager.run()
@@ -1,10 +1,15 @@
+from threading import Lock
+
 import numpy as np
 import pandas as pd
+from scipy.sparse import csr_matrix
 
 from trader.util.constants import BCH, BSV, BTC, EOS, ETH, LTC, NEO, XRP
 from trader.util.stats import Ema
 
-# TODO: fetch this dynamically
+FIELDS = ["price", "volume"]
+
+# Fallback supplies, used until a `SupplyProvider` publishes fetched ones.
 CIRCULATING_SUPPLY = pd.Series(
     {BTC: 18e6, ETH: 106e6, XRP: 42e9, BCH: 18e6, EOS: 913e6, LTC: 62e6, NEO: 65e6, BSV: 18e6}
 )
@@ -49,19 +54,373 @@ def compute_baskets(basket_specs, aggregates):
     return baskets
 
 
+def _signal_index(names):
+    """Builds the (name, field) index for signals without sorting the mixed-type names."""
+    return pd.MultiIndex(
+        levels=[pd.Index(names, dtype=object, tupleize_cols=False), pd.Index(FIELDS)],
+        codes=[np.repeat(np.arange(len(names)), len(FIELDS)), np.tile([0, 1], len(names))],
+    )
+
+
+def _supply_weights(supply, currencies):
+    # Scale down to avoid numerical instability.
+    return supply.reindex(currencies).values / 1e9
+
+
+def _nonzero_columns(matrix):
+    """Lists the column indices of the nonzero entries in every row of a sparse matrix."""
+    matrix = csr_matrix(matrix)
+    return [matrix.indices[matrix.indptr[r] : matrix.indptr[r + 1]] for r in range(matrix.shape[0])]
+
+
+class SignalsSnapshot:
+    """An immutable, versioned snapshot of aggregated signals.
+
+    Attributes:
+        version (int): Increases by one with every published snapshot.
+        values (ndarray): Read-only signal values, laid out like `signals`.
+
+    """
+
+    def __init__(self, version, values, index):
+        self.__version = version
+        self.__values = values
+        self.__values.flags.writeable = False
+        self.__index = index
+
+    @property
+    def version(self):
+        return self.__version
+
+    @property
+    def values(self):
+        return self.__values
+
+    @property
+    def signals(self):
+        """The snapshot as a (name, field) indexed Series."""
+        return pd.Series(self.__values, index=self.__index)
+
+    def __repr__(self):
+        return f"SignalsSnapshot(version={self.__version})"
+
+
 class SignalAggregator:
     """
     Adds cap-weighted baskets to frame.
     Frame should already be in usd.
+
+    Between steps, `update` applies single trades incrementally: only the traded pair's currency
+    aggregate and the baskets that contain that currency are recomputed, weighting quotes by the
+    moving volumes as of the last step. Volumes carry on from the step's volumes, with every trade
+    since added on top. Every step or update publishes a new `SignalsSnapshot`.
+
+    The pair universe of the frame is compiled once into sparse currency and basket weight matrices,
+    so a `step` is a handful of matrix-vector products over dense price and volume arrays. The
+    universe is recompiled only when the pairs in the frame change. `aggregate_currency_quotes` and
+    `compute_baskets` are the reference (label-based) implementations of the same computation.
     """
 
+    class Error(Exception):
+        pass
+
     def __init__(self, volume_half_life, baskets):
-        self.__moving_volumes = Ema(volume_half_life)
+        self.__volume_half_life = volume_half_life
+        self.__moving_volumes = Ema(volume_half_life, in_place=True)
         self.__baskets = baskets
+        self.__frame_index = None
+        self.__supply_source = CIRCULATING_SUPPLY
+        self.__lock = Lock()
+        self.__version = 0
+        self.__snapshot = None
+
+    @property
+    def snapshot(self):
+        """The latest published `SignalsSnapshot`, or None if nothing has been aggregated yet."""
+        return self.__snapshot
+
+    def __compile(self, index, values):
+        """Compiles the pair universe of `index` into weight matrices and output labels.
+
+        Args:
+            index (MultiIndex): (ExchangePair, field) labels of a frame.
+            values (ndarray): A frame with these labels, used to seed moving volumes of new pairs.
+
+        """
+        positions = {key: i for i, key in enumerate(index)}
+        pairs = list(dict.fromkeys(ep for ep, _ in index))
+        currencies = list(dict.fromkeys(ep.base for ep in pairs))
+        currency_ids = {c: i for i, c in enumerate(currencies)}
+
+        # Carry moving volumes over for pairs that were already in the universe.
+        if self.__frame_index is not None:
+            old_volumes = dict(zip(self.__pairs, self.__moving_volumes.value))
+            volumes = values[[positions[ep, "volume"] for ep in pairs]]
+            self.__moving_volumes = Ema(
+                self.__volume_half_life,
+                [old_volumes.get(ep, v) for ep, v in zip(pairs, volumes)],
+                in_place=True,
+            )
+
+        self.__frame_index = index
+        self.__pairs = pairs
+        self.__currencies = currencies
+        self.__price_positions = np.array([positions[ep, "price"] for ep in pairs])
+        self.__volume_positions = np.array([positions[ep, "volume"] for ep in pairs])
+        # Currency c aggregates every pair with base c.
+        self.__currency_weights = csr_matrix(
+            (
+                np.ones(len(pairs)),
+                ([currency_ids[ep.base] for ep in pairs], np.arange(len(pairs))),
+            ),
+            shape=(len(currencies), len(pairs)),
+        )
+        # Basket k sums the currencies it contains; prices are further weighted by supply.
+        rows, columns = [], []
+        for k, basket_currencies in enumerate(self.__baskets.values()):
+            for c in basket_currencies:
+                rows.append(k)
+                columns.append(currency_ids[c])
+        self.__basket_weights = csr_matrix(
+            (np.ones(len(rows)), (rows, columns)), shape=(len(self.__baskets), len(currencies))
+        )
+        self.__supply = _supply_weights(self.__supply_source, currencies)
+        self.__signal_index = _signal_index(currencies + list(self.__baskets))
+
+        # Sparsity patterns for incremental updates: the pairs of every currency and the baskets
+        # containing every currency.
+        self.__pair_ids = {ep: i for i, ep in enumerate(pairs)}
+        self.__pair_currencies = [currency_ids[ep.base] for ep in pairs]
+        self.__currency_members = _nonzero_columns(self.__currency_weights)
+        self.__basket_members = _nonzero_columns(self.__basket_weights)
+        self.__currency_baskets = _nonzero_columns(self.__basket_weights.T)
+
+    def set_supply(self, supply):
+        """Swaps in new circulating supplies for basket weights.
+
+        The weight vector is computed before taking the lock and swapped in as a whole, so a
+        concurrent `step` sees either the old or the new weights but never a mix of the two.
+
+        Args:
+            supply (Series): Circulating supply indexed by currency.
+
+        """
+        currencies = self.__currencies if self.__frame_index is not None else None
+        weights = None if currencies is None else _supply_weights(supply, currencies)
+        with self.__lock:
+            self.__supply_source = supply
+            if self.__frame_index is not None:
+                if currencies is not self.__currencies:
+                    # The universe was recompiled in the meantime.
+                    weights = _supply_weights(supply, self.__currencies)
+                self.__supply = weights
+
+    def __ensure_compiled(self, index, values):
+        if index is not self.__frame_index and not index.equals(self.__frame_index):
+            self.__compile(index, values)
+
+    def __aggregate(self, prices, volumes, moving_volumes):
+        """Aggregates pair quotes along the last axis into (..., name, field) signals."""
+
+        def apply(weights, X):
+            # Sparse product over the last axis of a vector or of a (time x pairs) matrix.
+            return (weights @ X.T).T
+
+        moving_volumes = moving_volumes + 1e-10
+        n_currencies = len(self.__currencies)
+        signals = np.empty(prices.shape[:-1] + (n_currencies + len(self.__baskets), len(FIELDS)))
+        signals[..., :n_currencies, 0] = apply(
+            self.__currency_weights, prices * moving_volumes
+        ) / apply(self.__currency_weights, moving_volumes)
+        signals[..., :n_currencies, 1] = apply(self.__currency_weights, np.nan_to_num(volumes))
+        signals[..., n_currencies:, 0] = apply(
+            self.__basket_weights, signals[..., :n_currencies, 0] * self.__supply
+        )
+        signals[..., n_currencies:, 1] = apply(
+            self.__basket_weights, signals[..., :n_currencies, 1]
+        )
+        return signals
+
+    def __reset_live(self, prices, moving_volumes, signals):
+        """Resets incremental state after a step, and publishes the step's signals.
+
+        Volumes of later incremental snapshots add the trades since this step to its volumes.
+        """
+        self.__live_prices = np.array(prices, dtype=np.float64)
+        self.__live_weights = moving_volumes + 1e-10
+        self.__live_weight_sums = self.__currency_weights @ self.__live_weights
+        self.__live = np.array(signals, dtype=np.float64)
+        self.__publish(signals.reshape(-1).copy())
+
+    def __publish(self, values):
+        self.__version += 1
+        self.__snapshot = SignalsSnapshot(self.__version, values, self.__signal_index)
+        return self.__snapshot
 
     def step(self, frame):
-        moving_volumes = self.__moving_volumes.step(frame.xs("volume", level=1))
+        values = frame.values
+        with self.__lock:
+            self.__ensure_compiled(frame.index, values)
+            prices = values[self.__price_positions]
+            volumes = values[self.__volume_positions]
+            moving_volumes = self.__moving_volumes.step(volumes)
+            signals = self.__aggregate(prices, volumes, moving_volumes)
+            self.__reset_live(prices, moving_volumes, signals)
+        return pd.Series(signals.reshape(-1), index=self.__signal_index)
+
+    def update(self, exchange_pair, price, volume):
+        """Incrementally applies a single trade to the signals of the last step.
+
+        Only the aggregate of the pair's base currency and the baskets containing that currency are
+        recomputed, so the cost is independent of the size of the universe.
+
+        Args:
+            exchange_pair (ExchangePair): The traded pair. Must be part of the compiled universe.
+            price (float): The trade price (in USD).
+            volume (float): The traded volume (in USD).
+
+        Returns:
+            SignalsSnapshot: The new snapshot.
+
+        """
+        with self.__lock:
+            if self.__snapshot is None:
+                raise SignalAggregator.Error("cannot update before the first step")
+            i = self.__pair_ids.get(exchange_pair)
+            if i is None:
+                raise SignalAggregator.Error(f"{exchange_pair} is not in the compiled universe")
+            c = self.__pair_currencies[i]
+            live = self.__live
+            n_currencies = len(self.__currencies)
+
+            self.__live_prices[i] = price
+            members = self.__currency_members[c]
+            weighted = self.__live_prices[members] @ self.__live_weights[members]
+            live[c, 0] = weighted / self.__live_weight_sums[c]
+            if not np.isnan(volume):
+                live[c, 1] += volume
+            for k in self.__currency_baskets[c]:
+                basket_currencies = self.__basket_members[k]
+                live[n_currencies + k, 0] = (
+                    live[basket_currencies, 0] @ self.__supply[basket_currencies]
+                )
+                live[n_currencies + k, 1] = live[basket_currencies, 1].sum()
+            return self.__publish(live.reshape(-1).copy())
+
+    def step_frame(self, data):
+        """Computes signals for every row of `data` in one vectorized pass.
+
+        Equivalent to `data.apply(self.step, axis=1)`, including the final state of the moving
+        volumes, but the universe is compiled once and moving volumes are filtered in bulk.
+
+        Args:
+            data (DataFrame): Frames indexed by time, with (ExchangePair, field) columns.
+
+        Returns:
+            DataFrame: Signals indexed by time, with (name, field) columns.
+
+        """
+        values = data.values
+        if len(values) == 0:
+            return data.apply(self.step, axis=1)
+        with self.__lock:
+            self.__ensure_compiled(data.columns, values[0])
+            prices = values[:, self.__price_positions]
+            volumes = values[:, self.__volume_positions]
+            moving_volumes = self.__moving_volumes.step_many(volumes)
+            signals = self.__aggregate(prices, volumes, moving_volumes)
+            self.__reset_live(prices[-1], moving_volumes[-1], signals[-1])
+        return pd.DataFrame(
+            signals.reshape(len(values), -1), index=data.index, columns=self.__signal_index
+        )
+
+
+def test_signal_aggregator():
+    """Tests the compiled aggregator against the reference implementation, across a universe
+    change."""
+    from trader.util.constants import BTC_USD, BTC_USDT, ETH_USD, ETH_USDT, XRP_USD
+    from trader.util.types import ExchangePair
+
+    rng = np.random.RandomState(0)
+    pairs = [BTC_USD, ETH_USD, XRP_USD, BTC_USDT, ETH_USDT]
+    exchange_pairs = [ExchangePair(e, p) for e in ["bitfinex", "binance"] for p in pairs]
+    baskets = {"total_market": [BTC, ETH, XRP], "large_caps": [BTC, ETH]}
+    aggregator = SignalAggregator(5, baskets)
+    reference_volumes = Ema(5)
+
+    for t in range(20):
+        # Drop a pair halfway through to force a recompile.
+        eps = exchange_pairs if t < 10 else exchange_pairs[1:]
+        index = pd.MultiIndex.from_product([eps, FIELDS])
+        frame = pd.Series(rng.rand(len(index)) + 1, index=index)
+
+        signals = aggregator.step(frame)
+        volumes = frame.xs("volume", level=1)
+        moving_volumes = reference_volumes.step(volumes)
+        if t >= 10:
+            reference_volumes = Ema(5, moving_volumes.dropna())
+            moving_volumes = moving_volumes.dropna()
         aggregates = aggregate_currency_quotes(moving_volumes, frame)
-        baskets = compute_baskets(self.__baskets, aggregates)
-        signals = pd.concat([aggregates, baskets]).astype(np.float64)
-        return signals
+        for expected in [aggregates, compute_baskets(baskets, aggregates)]:
+            for key, value in expected.items():
+                assert np.isclose(signals[key], value, rtol=1e-9)
+
+
+def test_signal_aggregator_step_frame():
+    """Tests that bulk aggregation matches stepping row by row."""
+    from trader.util.constants import BTC_USD, ETH_USD, XRP_USD
+    from trader.util.types import ExchangePair
+
+    rng = np.random.RandomState(1)
+    exchange_pairs = [ExchangePair("bitfinex", p) for p in [BTC_USD, ETH_USD, XRP_USD]]
+    columns = pd.MultiIndex.from_product([exchange_pairs, FIELDS])
+    data = pd.DataFrame(rng.rand(60, len(columns)) + 1, columns=columns)
+    baskets = {"total_market": [BTC, ETH, XRP]}
+
+    looped = SignalAggregator(10, baskets)
+    bulk = SignalAggregator(10, baskets)
+    expected = pd.DataFrame([looped.step(row) for _, row in data.iterrows()])
+    signals = pd.concat([bulk.step_frame(data.iloc[:30]), bulk.step_frame(data.iloc[30:])])
+    np.testing.assert_allclose(signals.values, expected.values, rtol=1e-9)
+
+    frame = data.iloc[-1]
+    np.testing.assert_allclose(bulk.step(frame).values, looped.step(frame).values, rtol=1e-9)
+
+
+def test_signal_aggregator_update():
+    """Tests that incremental trade updates match the reference implementation."""
+    from trader.util.constants import BTC_USD, BTC_USDT, ETH_USD, XRP_USD
+    from trader.util.types import ExchangePair
+
+    rng = np.random.RandomState(2)
+    exchange_pairs = [ExchangePair("bitfinex", p) for p in [BTC_USD, ETH_USD, XRP_USD, BTC_USDT]]
+    index = pd.MultiIndex.from_product([exchange_pairs, FIELDS])
+    baskets = {"total_market": [BTC, ETH, XRP], "large_caps": [BTC, ETH]}
+    aggregator = SignalAggregator(10, baskets)
+    reference_volumes = Ema(10)
+    for _ in range(5):
+        frame = pd.Series(rng.rand(len(index)) + 1, index=index)
+        aggregator.step(frame)
+        moving_volumes = reference_volumes.step(frame.xs("volume", level=1))
+    version = aggregator.snapshot.version
+
+    # Incremental volumes add trades to the last step's, and prices are the latest trades.
+    for t in range(30):
+        ep = exchange_pairs[rng.randint(len(exchange_pairs))]
+        price, volume = rng.rand() + 1, rng.rand()
+        frame[ep, "price"] = price
+        frame[ep, "volume"] += volume
+        snapshot = aggregator.update(ep, price, volume)
+        assert snapshot.version == version + t + 1
+
+    try:
+        aggregator.update(ExchangePair("binance", BTC_USD), 1.0, 1.0)
+        assert False
+    except SignalAggregator.Error:
+        pass
+
+    signals = snapshot.signals
+    aggregates = aggregate_currency_quotes(moving_volumes, frame)
+    for expected in [aggregates, compute_baskets(baskets, aggregates)]:
+        for key, value in expected.items():
+            assert np.isclose(signals[key], value, rtol=1e-9)
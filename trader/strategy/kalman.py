@@ -68,8 +68,7 @@ class Kalman(Strategy):
         self.price_history = RingBuffer(self.window_size, dtype=(np.float64, len(prices.columns)))
         self.price_history.extend(prices.values)
 
-        for _, p in prices.iloc[-trend_hl * 4 :].iterrows():
-            self.moving_prices.step(p)
+        self.moving_prices.step_many(prices.iloc[-trend_hl * 4 :])
 
         self.moving_volumes = Ema(movement_hl, volumes.mean())
 
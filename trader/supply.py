@@ -0,0 +1,216 @@
+"""The `supply` module.
+
+Circulating supplies of currencies, fetched off the tick path and cached on disk.
+
+"""
+
+import json
+import os
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from threading import Lock
+
+import numpy as np
+import pandas as pd
+
+from trader.signal_aggregator import CIRCULATING_SUPPLY
+from trader.util import Log
+from trader.util.types import Currency
+
+
+def _to_json(supply):
+    return {str(currency): float(size) for currency, size in supply.items()}
+
+
+def _from_json(supply):
+    return pd.Series({Currency(currency): float(size) for currency, size in supply.items()})
+
+
+class SupplySource(ABC):
+    """An abstract source of circulating supplies."""
+
+    @abstractmethod
+    def fetch(self):
+        """Fetches the latest circulating supplies. May block, and may raise on failure.
+
+        Returns:
+            Series: Circulating supply indexed by currency.
+
+        """
+
+
+class FileSupplySource(SupplySource):
+    """Reads circulating supplies from a JSON file mapping currency ids to supplies.
+
+    Args:
+        path (str): Path of the JSON file.
+
+    """
+
+    def __init__(self, path):
+        self.__path = path
+
+    def fetch(self):
+        with open(self.__path) as supply_file:
+            return _from_json(json.load(supply_file))
+
+
+class SupplyProvider:
+    """Keeps circulating supplies fresh without ever blocking readers.
+
+    Supplies are cached on disk with their fetch time. On construction the provider serves the
+    cached supplies (whatever their age) or `CIRCULATING_SUPPLY` if there is no cache, and a
+    background thread refreshes from `source` whenever the cache is older than `ttl`. Each refresh
+    is written to the cache atomically and published to every subscriber, such as
+    `SignalAggregator.set_supply`. Deliveries are serialised, so a subscriber never gets an older
+    set of supplies after a newer one; subscribers must not subscribe from within a delivery.
+
+    Args:
+        thread_manager (ThreadManager): A thread manager to attach the refresh thread to.
+        source (SupplySource): Where to fetch supplies from.
+        cache_path (str): Path of the on-disk JSON cache.
+        ttl (float): Seconds before cached supplies are refreshed.
+        retry_interval (float): Seconds to wait after a failed refresh.
+
+    """
+
+    def __init__(self, thread_manager, source, cache_path, ttl=86400, retry_interval=60):
+        self.__source = source
+        self.__cache_path = cache_path
+        self.__ttl = ttl
+        self.__retry_interval = retry_interval
+        self.__subscribers = []
+        # Held while the supplies are replaced and delivered, so deliveries happen in order.
+        self.__publish_lock = Lock()
+        self.__supply = CIRCULATING_SUPPLY
+        self.__fetched_at = None
+        self.__load_cache()
+        thread_manager.attach("supply-provider", self.__run)
+
+    @property
+    def supply(self):
+        """The latest circulating supplies, indexed by currency."""
+        return self.__supply
+
+    @property
+    def age(self):
+        """Seconds since the current supplies were fetched (infinite for the fallback)."""
+        if self.__fetched_at is None:
+            return np.inf
+        return time.time() - self.__fetched_at
+
+    def subscribe(self, fn):
+        """Calls `fn` with the current supplies now and with every refreshed set of supplies."""
+        with self.__publish_lock:
+            self.__subscribers.append(fn)
+            fn(self.__supply)
+
+    def __load_cache(self):
+        try:
+            with open(self.__cache_path) as cache_file:
+                cache = json.load(cache_file)
+            self.__supply = _from_json(cache["supply"])
+            self.__fetched_at = cache["fetched_at"]
+        except FileNotFoundError:
+            Log.info("No circulating supply cache; using fallback supplies.")
+        except (ValueError, KeyError) as err:
+            Log.warn("Ignoring corrupt circulating supply cache: {}".format(err))
+
+    def __write_cache(self, supply, fetched_at):
+        # Write to a temporary file and rename it over the cache so readers never see a torn file.
+        directory = os.path.dirname(os.path.abspath(self.__cache_path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as temp_file:
+            json.dump({"fetched_at": fetched_at, "supply": _to_json(supply)}, temp_file)
+        os.replace(temp_path, self.__cache_path)
+
+    def refresh(self):
+        """Fetches supplies from the source, caches them, and publishes them to subscribers."""
+        supply = self.__source.fetch()
+        fetched_at = time.time()
+        self.__write_cache(supply, fetched_at)
+        with self.__publish_lock:
+            self.__supply = supply
+            self.__fetched_at = fetched_at
+            for fn in self.__subscribers:
+                fn(supply)
+        Log.info("Refreshed circulating supplies.")
+
+    def __run(self):
+        while True:
+            time_to_refresh = self.__ttl - self.age
+            if time_to_refresh > 0:
+                time.sleep(time_to_refresh)
+            try:
+                self.refresh()
+            except Exception as err:
+                Log.warn("Failed to refresh circulating supplies: {}".format(err))
+                time.sleep(self.__retry_interval)
+
+
+def test_supply_provider():
+    """Tests caching, refreshing, and publishing supplies to an aggregator."""
+    from trader.signal_aggregator import FIELDS, SignalAggregator
+    from trader.util.constants import BTC, BTC_USD, ETH, ETH_USD
+    from trader.util.thread import ThreadManager
+    from trader.util.types import ExchangePair
+
+    class FailingSource(SupplySource):
+        def fetch(self):
+            raise Exception("source should not be needed")
+
+    exchange_pairs = [ExchangePair("bitfinex", p) for p in [BTC_USD, ETH_USD]]
+    frame = pd.Series(1.0, index=pd.MultiIndex.from_product([exchange_pairs, FIELDS]))
+    aggregator = SignalAggregator(10, {"total_market": [BTC, ETH]})
+    aggregator.step(frame)
+
+    with tempfile.TemporaryDirectory() as directory:
+        source_path = os.path.join(directory, "supply.json")
+        cache_path = os.path.join(directory, "cache.json")
+        with open(source_path, "w") as source_file:
+            json.dump({"BTC": 2e9, "ETH": 3e9}, source_file)
+
+        # The refresh thread is never started; refreshes are triggered by hand.
+        provider = SupplyProvider(ThreadManager(), FileSupplySource(source_path), cache_path)
+        assert provider.age == np.inf
+        provider.subscribe(aggregator.set_supply)
+        assert aggregator.step(frame)["total_market", "price"] == (18e6 + 106e6) / 1e9
+
+        provider.refresh()
+        assert aggregator.step(frame)["total_market", "price"] == 5.0
+        assert provider.age < 60
+
+        cached = SupplyProvider(ThreadManager(), FailingSource(), cache_path)
+        assert cached.supply[ETH] == 3e9
+        assert cached.age < 60
+
+
+def test_supply_provider_ordering():
+    """Tests that a refresh during a subscriber's first delivery is delivered after it."""
+    from threading import Thread
+
+    from trader.util.constants import ETH
+    from trader.util.thread import ThreadManager
+
+    with tempfile.TemporaryDirectory() as directory:
+        source_path = os.path.join(directory, "supply.json")
+        with open(source_path, "w") as source_file:
+            json.dump({"ETH": 3e9}, source_file)
+        cache_path = os.path.join(directory, "cache.json")
+        provider = SupplyProvider(ThreadManager(), FileSupplySource(source_path), cache_path)
+
+        delivered = []
+        refreshers = []
+
+        def subscriber(supply):
+            if not refreshers:
+                # Give a refresh on another thread the chance to overtake this delivery.
+                refreshers.append(Thread(target=provider.refresh))
+                refreshers[0].start()
+                refreshers[0].join(0.1)
+            delivered.append(supply)
+
+        provider.subscribe(subscriber)
+        refreshers[0].join()
+        assert [supply[ETH] for supply in delivered] == [CIRCULATING_SUPPLY[ETH], 3e9]
@@ -1,9 +1,12 @@
+import numpy as np
 import pandas as pd
 
+from trader.util import Gaussian
+from trader.util.constants import STABLECOINS, USD
+
 
-# TODO: actually convert quotes, not just volume
-# think about how to do this. what if a quote_usd pair does not exist on a particular exchange?
 def convert_quotes_to_usd(frame):
+    """Converts volumes of a USD-quoted frame to USD. Kept as a reference for `UsdConverter`."""
     frame = frame.copy()
     # .values call necessary because assigning to indexslices is buggy
     # see https://github.com/pandas-dev/pandas/issues/10440
@@ -13,18 +16,203 @@ def convert_quotes_to_usd(frame):
     return frame
 
 
+def _find_routes(pairs, quotes):
+    """Finds a chain of pairs linking every quote currency to USD.
+
+    Breadth-first search over the currency graph whose edges are the given pairs, so the shortest
+    chain wins. Since 1 base = p quote, walking a pair from quote to base multiplies the USD rate by
+    its price and walking it from base to quote divides by it.
+
+    Returns:
+        dict: Map from currency to a list of (pair position, exponent) factors, for every currency
+            reachable from USD.
+
+    """
+    routes = {USD: []}
+    frontier = [USD]
+    while frontier:
+        currency = frontier.pop(0)
+        for i, ep in enumerate(pairs):
+            if ep.quote == currency and ep.base not in routes:
+                routes[ep.base] = routes[currency] + [(i, 1)]
+                frontier.append(ep.base)
+            elif ep.base == currency and ep.quote not in routes:
+                routes[ep.quote] = routes[currency] + [(i, -1)]
+                frontier.append(ep.quote)
+    return {q: routes[q] for q in quotes if q in routes}
+
+
 class UsdConverter:
     """
-    Converts non-usd quotes to USD, and back. Also converts volumes.
+    Converts non-usd quotes to USD, and back. Also converts volumes to USD notional.
+
+    The pairs of the first frame are compiled into a conversion graph: every quote currency gets a
+    chain of pairs linking it to USD (e.g. USDT through USDT-USD, or through BTC-USD and BTC-USDT).
+    Cross rates are products over those chains, computed with one gather and a `multiply.reduceat`
+    over the frame's prices, and the last finite rate of each quote is cached for ticks where a
+    chain is missing a price. Stablecoins without a chain are taken at par; other quotes without a
+    chain convert to NaN. Conversion in either direction is then a gather-multiply of the frame by
+    per-pair factors. The universe is recompiled only when the pairs in the frame change.
     """
 
     def __init__(self):
         self.current_frame = None
+        self.__frame_index = None
+
+    @property
+    def rates(self):
+        """The cached cross rates to USD, indexed by quote currency."""
+        return pd.Series(self.__cached_rates, index=self.__quotes)
+
+    def __compile(self, index):
+        positions = {key: i for i, key in enumerate(index)}
+        pairs = list(dict.fromkeys(ep for ep, _ in index))
+        quotes = list(dict.fromkeys(ep.quote for ep in pairs))
+        routes = _find_routes(pairs, quotes)
+
+        # Factors index the pair prices extended with a constant 1 (for USD and stablecoins) and
+        # a constant NaN (for quotes without a route).
+        one, nan = len(pairs), len(pairs) + 1
+        factor_positions, exponents, starts = [], [], []
+        for quote in quotes:
+            starts.append(len(factor_positions))
+            if quote in routes and routes[quote]:
+                route = routes[quote]
+            else:
+                route = [(one if quote in routes or quote in STABLECOINS else nan, 1)]
+            for position, exponent in route:
+                factor_positions.append(position)
+                exponents.append(exponent)
+
+        self.__frame_index = index
+        self.__pairs = pairs
+        self.__quotes = quotes
+        self.__price_positions = np.array([positions[ep, "price"] for ep in pairs])
+        self.__volume_positions = np.array([positions[ep, "volume"] for ep in pairs])
+        self.__factor_positions = np.array(factor_positions)
+        self.__exponents = np.array(exponents, dtype=np.float64)
+        self.__starts = np.array(starts)
+        self.__pair_quotes = np.array([quotes.index(ep.quote) for ep in pairs])
+        self.__cached_rates = np.full(len(quotes), np.nan)
+        self.__pair_factors = np.full(len(pairs), np.nan)
+
+    def __ensure_compiled(self, index):
+        if index is not self.__frame_index and not index.equals(self.__frame_index):
+            self.__compile(index)
+
+    def __cross_rates(self, prices):
+        """Computes cross rates to USD along the last axis of `prices`, one per quote."""
+        constants = np.broadcast_to([1.0, np.nan], prices.shape[:-1] + (2,))
+        extended = np.concatenate([prices, constants], axis=-1)
+        factors = np.power(extended[..., self.__factor_positions], self.__exponents)
+        return np.multiply.reduceat(factors, self.__starts, axis=-1)
+
+    def __convert(self, values, pair_factors):
+        """Converts (..., pair, field) frame values to USD given per-pair price factors."""
+        converted = np.array(values, dtype=np.float64)
+        prices = converted[..., self.__price_positions]
+        converted[..., self.__volume_positions] *= prices * pair_factors
+        converted[..., self.__price_positions] = prices * pair_factors
+        return converted
 
     def step(self, frame):
         self.current_frame = frame
-        frame = convert_quotes_to_usd(frame)
-        return frame
+        self.__ensure_compiled(frame.index)
+        values = frame.values
+        rates = self.__cross_rates(values[self.__price_positions])
+        np.copyto(self.__cached_rates, rates, where=np.isfinite(rates))
+        self.__pair_factors = self.__cached_rates[self.__pair_quotes]
+        return pd.Series(self.__convert(values, self.__pair_factors), index=frame.index)
+
+    def step_frame(self, data):
+        """Converts every row of `data` in one vectorized pass.
+
+        Equivalent to `data.apply(self.step, axis=1)`, including the final cached rates.
+
+        Args:
+            data (DataFrame): Frames indexed by time, with (ExchangePair, field) columns.
+
+        Returns:
+            DataFrame: The converted frames.
+
+        """
+        if len(data) == 0:
+            return data.copy()
+        self.__ensure_compiled(data.columns)
+        values = data.values
+        rates = self.__cross_rates(values[:, self.__price_positions])
+        # Carry the last finite rate forward, starting from the currently cached rates.
+        rates = pd.DataFrame(np.vstack([self.__cached_rates, rates])).ffill().values[1:]
+        self.__cached_rates = rates[-1].copy()
+        self.__pair_factors = self.__cached_rates[self.__pair_quotes]
+        self.current_frame = data.iloc[-1]
+        converted = self.__convert(values, rates[:, self.__pair_quotes])
+        return pd.DataFrame(converted, index=data.index, columns=data.columns)
 
     def unconvert(self, usd_prices):
-        pass
+        """Converts USD prices back to the quote currency of each pair at the latest rates.
+
+        Args:
+            usd_prices: A Series or `Gaussian` of prices indexed by ExchangePair.
+
+        Returns:
+            The same type as `usd_prices`, in quote currencies.
+
+        """
+        labels = usd_prices.mean.index if isinstance(usd_prices, Gaussian) else usd_prices.index
+        # Divide by a plain array aligned to the labels, which `Gaussian` scales positionally.
+        factors = pd.Series(self.__pair_factors, index=self.__pairs).reindex(labels).values
+        return usd_prices / factors
+
+
+def test_usd_converter():
+    """Tests conversion through direct and triangulated cross rates, in both directions."""
+    from trader.util.constants import BTC, BTC_USD, BTC_USDT, ETH, ETH_USDT, USDT
+    from trader.util.types import Currency, ExchangePair, TradingPair
+
+    eth_btc = TradingPair(ETH, BTC)
+    exchange_pairs = [
+        ExchangePair("bitfinex", BTC_USD),
+        ExchangePair("binance", BTC_USDT),
+        ExchangePair("binance", ETH_USDT),
+        ExchangePair("binance", eth_btc),
+        ExchangePair("binance", TradingPair(Currency("XYZ"), Currency("ABC"))),
+    ]
+    columns = pd.MultiIndex.from_product([exchange_pairs, ["price", "volume"]])
+    data = pd.DataFrame(
+        [
+            [8000, 1, 8080, 2, 202, 3, 0.025, 4, 1, 5],
+            [8100, 1, np.nan, 2, 202, 3, 0.025, 4, 1, 5],
+        ],
+        columns=columns,
+        dtype=np.float64,
+    )
+
+    converter = UsdConverter()
+    looped = pd.DataFrame([converter.step(row) for _, row in data.iterrows()])
+    bulk_converter = UsdConverter()
+    bulk = bulk_converter.step_frame(data)
+    np.testing.assert_allclose(bulk.values, looped.values)
+    np.testing.assert_allclose(bulk_converter.rates.values, converter.rates.values)
+
+    first = bulk.iloc[0]
+    usdt_rate = 8000 / 8080
+    assert np.isclose(first[exchange_pairs[2], "price"], 202 * usdt_rate)
+    assert np.isclose(first[exchange_pairs[2], "volume"], 3 * 202 * usdt_rate)
+    assert np.isclose(first[exchange_pairs[3], "price"], 0.025 * 8000)
+    assert np.isnan(first[exchange_pairs[4], "price"])
+    # A missing BTC-USDT price keeps the cached USDT rate.
+    assert np.isclose(bulk.iloc[1][exchange_pairs[2], "price"], 202 * usdt_rate)
+
+    usd_prices = bulk.iloc[1].xs("price", level=1)
+    expected = data.iloc[1].xs("price", level=1).values
+    unconverted = converter.unconvert(usd_prices).values
+    np.testing.assert_allclose(unconverted[[0, 2, 3]], expected[[0, 2, 3]])
+
+    # Gaussians scale their covariance with the square of the conversion.
+    fairs = converter.unconvert(Gaussian(usd_prices, [1.0] * len(usd_prices)))
+    np.testing.assert_allclose(fairs.mean.values[[0, 2, 3]], expected[[0, 2, 3]])
+    factors = usd_prices.values / unconverted
+    variances = np.diag(fairs.covariance.values)
+    np.testing.assert_allclose(variances[[0, 2, 3]], 1 / factors[[0, 2, 3]] ** 2)
+    assert converter.rates[USDT] == usdt_rate and converter.rates[BTC] == 8100
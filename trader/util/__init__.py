@@ -4,6 +4,6 @@ Module-wide utilities that do not belong elsewhere.
 
 """
 
-from trader.util.feed import Feed
+from trader.util.feed import AsyncFeed, Feed
 from trader.util.gaussian import Gaussian, GaussianError
 from trader.util.log import Log
@@ -1,12 +1,291 @@
+import asyncio
+import inspect
 import itertools
+import math
 import time
+from collections import OrderedDict, deque
+from enum import Enum
 from functools import partial, reduce
-from queue import Full, Queue
-from threading import Thread
+from queue import Full
+from threading import Condition, Lock, Thread, current_thread
+from weakref import WeakValueDictionary
 
+from trader.util.log import Log
 from trader.util.thread import MVar, ThreadManager
 
 
+class _RateMeter:
+    """Counts events in one-second buckets, for throughput over windows of up to a minute."""
+
+    __num_buckets = 61
+
+    def __init__(self):
+        self.__buckets = [0] * _RateMeter.__num_buckets
+        self.__second = 0
+        self.__next_second = 1
+        self.__current = 0
+        self.count = 0
+
+    def mark(self, now, n=1):
+        self.count += n
+        if now < self.__next_second:
+            self.__current += n
+        else:
+            self.__roll(int(now))
+            self.__current = n
+
+    def __roll(self, second):
+        # Stores the count of the current second and starts counting `second`.
+        num_buckets = _RateMeter.__num_buckets
+        if second - self.__second >= num_buckets:
+            self.__buckets = [0] * num_buckets
+        else:
+            self.__buckets[self.__second % num_buckets] = self.__current
+            for s in range(self.__second + 1, second):
+                self.__buckets[s % num_buckets] = 0
+        self.__second = second
+        self.__next_second = second + 1
+
+    def rate(self, window, now):
+        """Events per second over the `window` one-second buckets up to and including `now`."""
+        num_buckets = _RateMeter.__num_buckets
+        last = self.__second
+        total = 0
+        for s in range(int(now) - window + 1, int(now) + 1):
+            if s == last:
+                total += self.__current
+            elif last - num_buckets < s < last:
+                total += self.__buckets[s % num_buckets]
+        return total / window
+
+
+class _SinkQueue:
+    """The queue between a feed and one of its sinks, applying a `Feed.Backpressure` policy when
+    it is full. Iterating it yields items until it is closed and drained, and `batches` yields
+    lists of items instead.
+
+    Waiters are counted so that writers only pay for a notification when someone is waiting. Items
+    are stamped with their enqueue time to measure how far the reader lags behind the writer.
+
+    """
+
+    def __init__(self, maxsize, backpressure):
+        if backpressure == Feed.Backpressure.CONFLATE:
+            maxsize = 1
+        self.__maxsize = maxsize
+        self.__backpressure = backpressure
+        self.__items = deque()
+        self.__closed = False
+        self.__lock = Lock()
+        self.__condition = Condition(self.__lock)
+        self.__waiters = 0
+        self.dropped = 0
+        self.conflated = 0
+        self.items_in = 0
+        self.items_out = 0
+        self.peak_depth = 0
+        self.lag = 0.0
+        self.max_lag = 0.0
+
+    def put(self, item):
+        with self.__lock:
+            if self.__maxsize and len(self.__items) >= self.__maxsize:
+                if self.__backpressure == Feed.Backpressure.RAISE:
+                    raise Full
+                elif self.__backpressure == Feed.Backpressure.BLOCK:
+                    while len(self.__items) >= self.__maxsize:
+                        self.__wait()
+                elif self.__backpressure == Feed.Backpressure.DROP_OLDEST:
+                    self.__items.popleft()
+                    self.dropped += 1
+                elif self.__backpressure == Feed.Backpressure.DROP_NEWEST:
+                    self.dropped += 1
+                    return
+                else:
+                    self.__items.popleft()
+                    self.conflated += 1
+            self.__items.append((time.monotonic(), item))
+            self.items_in += 1
+            if len(self.__items) > self.peak_depth:
+                self.peak_depth = len(self.__items)
+            if self.__waiters:
+                self.__condition.notify_all()
+
+    def __wait(self, timeout=None):
+        self.__waiters += 1
+        try:
+            return self.__condition.wait(timeout)
+        finally:
+            self.__waiters -= 1
+
+    def __taken(self, count, enqueued_at):
+        # Records `count` items taken, the oldest of which was enqueued at `enqueued_at`.
+        self.items_out += count
+        self.lag = time.monotonic() - enqueued_at
+        if self.lag > self.max_lag:
+            self.max_lag = self.lag
+        if self.__waiters:
+            self.__condition.notify_all()
+
+    def close(self):
+        with self.__lock:
+            # The end of the feed takes a slot like any other item under RAISE.
+            if self.__backpressure == Feed.Backpressure.RAISE and self.__maxsize:
+                if len(self.__items) >= self.__maxsize:
+                    raise Full
+            self.__closed = True
+            self.__condition.notify_all()
+
+    def stats(self, now):
+        """Counters of this queue, and the age in seconds of its oldest item as `oldest`."""
+        with self.__lock:
+            return {
+                "items_in": self.items_in,
+                "items_out": self.items_out,
+                "depth": len(self.__items),
+                "peak_depth": self.peak_depth,
+                "lag": self.lag,
+                "max_lag": self.max_lag,
+                "oldest": now - self.__items[0][0] if self.__items else 0.0,
+                "dropped": self.dropped,
+                "conflated": self.conflated,
+            }
+
+    def __iter__(self):
+        while True:
+            with self.__lock:
+                while not self.__items and not self.__closed:
+                    self.__wait()
+                if not self.__items:
+                    return
+                enqueued_at, item = self.__items.popleft()
+                # Inlined `__taken`, since this is the hot path.
+                self.items_out += 1
+                self.lag = lag = time.monotonic() - enqueued_at
+                if lag > self.max_lag:
+                    self.max_lag = lag
+                if self.__waiters:
+                    self.__condition.notify_all()
+            yield item
+
+    def batches(self, max_size, linger=0):
+        """Yields lists of up to `max_size` items, each drained under a single lock acquisition.
+
+        Args:
+            max_size (int): The maximum number of items in a batch.
+            linger (float): Seconds to wait for a batch to fill up after its first item arrives.
+
+        """
+        while True:
+            with self.__lock:
+                while not self.__items and not self.__closed:
+                    self.__wait()
+                if linger > 0:
+                    deadline = time.monotonic() + linger
+                    while len(self.__items) < max_size and not self.__closed:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self.__wait(remaining)
+                if not self.__items:
+                    return
+                enqueued_at = self.__items[0][0]
+                size = min(max_size, len(self.__items))
+                batch = [self.__items.popleft()[1] for _ in range(size)]
+                self.__taken(size, enqueued_at)
+            yield batch
+
+    def samples(self, interval):
+        """Yields the newest item at most once every `interval` seconds, discarding older ones.
+
+        Args:
+            interval (float): The minimum number of seconds between items.
+
+        """
+        next_at = time.monotonic()
+        while True:
+            with self.__lock:
+                while not self.__items and not self.__closed:
+                    self.__wait()
+                if not self.__items:
+                    return
+            # Only this reader takes items, so there is still one after sleeping.
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            with self.__lock:
+                enqueued_at, item = self.__items.pop()
+                self.conflated += len(self.__items)
+                self.__items.clear()
+                self.__taken(1, enqueued_at)
+            next_at = time.monotonic() + interval
+            yield item
+
+
+class _MergedQueue(_SinkQueue):
+    """A sink queue shared by several feeds, which yields `(index, item)` pairs tagged with the
+    index of the feed each item came from. It closes once every feed has closed."""
+
+    def __init__(self, num_feeds, maxsize, backpressure):
+        super().__init__(maxsize, backpressure)
+        self.__open_feeds = num_feeds
+        self.__feeds_lock = Lock()
+
+    def sink(self, index):
+        """The sink to attach to the feed at `index`."""
+        return _TaggedSink(self, index)
+
+    def close(self):
+        with self.__feeds_lock:
+            self.__open_feeds -= 1
+            if self.__open_feeds > 0:
+                return
+        super().close()
+
+
+class _ZippedQueues:
+    """The sink queues of the feeds of a `Feed.zip`, one per feed, whose stats are reported
+    together: counters are summed, and depths and lags are those of the fullest and slowest
+    queue."""
+
+    def __init__(self, queues):
+        self.__queues = queues
+
+    def __iter__(self):
+        iterators = [iter(queue) for queue in self.__queues]
+        yield from zip(*iterators)
+        # Drain the unmatched items of the feeds that are still running, so that none of them
+        # waits forever on a full queue.
+        for items in iterators:
+            for _ in items:
+                pass
+
+    @property
+    def dropped(self):
+        return sum(queue.dropped for queue in self.__queues)
+
+    @property
+    def conflated(self):
+        return sum(queue.conflated for queue in self.__queues)
+
+    def stats(self, now):
+        stats = [queue.stats(now) for queue in self.__queues]
+        summed = ["items_in", "items_out", "dropped", "conflated"]
+        return {key: (sum if key in summed else max)(s[key] for s in stats) for key in stats[0]}
+
+
+class _TaggedSink:
+    def __init__(self, queue, index):
+        self.__queue = queue
+        self.__index = index
+
+    def put(self, item):
+        self.__queue.put((self.__index, item))
+
+    def close(self):
+        self.__queue.close()
+
+
 class Feed:
     """A multicast stream type for Python.
 
@@ -15,46 +294,130 @@ class Feed:
     Transformations of a feed (such as `map` or `filter`) return both a result and a function to run
     the transformation on a separate thread.
 
-    TODO: Allow transformations that change the iterable on the same thread. This makes the library
-    less mistake-proof, since `feed.map(foo)` might have unexpected behavior if `feed.map_in_place`
-    (for example) is called later on.
+    Each transformation costs a queue hop and a thread. To run a chain of stateless transformations
+    on one thread, build it with `pipe` instead, e.g. `feed.pipe().map(f).filter(g).feed()`.
 
     """
 
     class Error(Exception):
         pass
 
+    class Backpressure(Enum):
+        """What a sink does with a new item when its buffer is full."""
+
+        # Raise `queue.Full` on the parent feed's thread.
+        RAISE = 1
+        # Block the parent feed until the sink has room.
+        BLOCK = 2
+        # Discard the oldest buffered item.
+        DROP_OLDEST = 3
+        # Discard the new item.
+        DROP_NEWEST = 4
+        # Replace the buffered item; the buffer holds only the latest item, whatever its size.
+        CONFLATE = 5
+
+    class Pipeline:
+        """A chain of stateless transformations of a feed, fused into a single stage.
+
+        Items pass through every step of the chain on one thread and with one queue hop, as chained
+        iterators. Steps only run when the pipeline is turned into a feed (or folded or subscribed
+        to), which attaches a single sink to the parent feed; the resulting feed is multicast as
+        usual. Pipelines are immutable, so a chain may be extended in several ways, but each
+        extension that is turned into a feed runs the shared steps again. To share work where a
+        chain branches, turn the shared prefix into a feed and branch from it.
+
+        NOTE: Use `Feed.pipe()` to start a pipeline.
+
+        """
+
+        def __init__(self, feed, steps=()):
+            self.__feed = feed
+            self.__steps = steps
+
+        def __then(self, step):
+            return Feed.Pipeline(self.__feed, self.__steps + (step,))
+
+        def __transform(self, items):
+            return reduce(lambda it, step: step(it), self.__steps, items)
+
+        def map(self, fn):
+            return self.__then(partial(map, fn))
+
+        def filter(self, fn):
+            return self.__then(partial(filter, fn))
+
+        def feed(self, **kwargs):
+            """Fuses the pipeline into one transformation of the parent feed.
+
+            Args:
+                kwargs: Arguments to `Feed._sink`.
+
+            Returns:
+                (Feed, Function): The transformed feed and a function to run the whole pipeline.
+
+            """
+            return self.__feed._sink(self.__transform, **kwargs)
+
+        def fold(self, fn, acc, **kwargs):
+            """Like `Feed.fold`, with the accumulation fused into the pipeline."""
+            current_acc = acc
+            acc_var = MVar()
+
+            def update(item):
+                nonlocal current_acc
+                current_acc = fn(item, current_acc)
+                acc_var.swap(current_acc)
+
+            _, runner = self.map(update).feed(**kwargs)
+            return acc_var, runner
+
+        def subscribe(self, fn, **kwargs):
+            """Like `Feed.subscribe`, with the subscriber fused into the pipeline."""
+            _, runner = self.map(fn).feed(**kwargs)
+            return runner
+
     # Hacky solution to prevent manual construction.
     __private = object()
 
-    # Sentinel value for the end of items in a feed (None is more conventional, but may lead to
-    # unexpected results if people want to use None in their feeds).
-    __end = object()
-
-    def __init__(self, private, iterable, initializer=None):
+    def __init__(self, private, iterable, initializer=None, source=None, name=None):
         if private != Feed.__private:
             raise Feed.Error("constructor is private")
         self.__iterable = iterable
         self.__initializer = initializer
+        self.__source = source
+        self.__name = name
+        self.__meter = _RateMeter()
         self.__latest = MVar()
         self.__sinks = []
         self.__done = False
 
     @staticmethod
-    def of(iterable):
+    def of(iterable, name=None):
         """Static constructor for Feed.
 
         Args:
             iterable: An iterable to initialize the feed from.
+            name (str): A name for the feed in `FEEDS`. Defaults to the name of the thread that
+                runs it.
 
         Returns:
             (Feed, Function): The feed and a function to run the feed's iterable.
 
         """
-        feed = Feed(Feed.__private, iterable)
+        feed = Feed(Feed.__private, iterable, name=name)
         return (feed, feed._run)
 
-    def _sink(self, transform, buffer_size=None, attach_lazy=True):
+    def _sink(
+        self,
+        transform,
+        buffer_size=None,
+        attach_lazy=True,
+        backpressure=Backpressure.RAISE,
+        batch_size=None,
+        linger=0,
+        interval=None,
+        name=None,
+    ):
         """Creates a new feed by transforming the iterable of this feed.
 
         Prefer calling `map`, `filter`, or any of the other specialized versions of this method.
@@ -65,18 +428,66 @@ class Feed:
                 you do not want the parent writer feed to outpace the child reader feed.
             attach_lazy (bool): When True, items will not be placed in the sink queue until the
                 transformed feed is actually run.
+            backpressure (Feed.Backpressure): What to do with new items when the sink queue is
+                full. Counts of dropped and conflated items are kept on the transformed feed.
+            batch_size (int): When set, `transform` is given an iterable of lists of up to this many
+                items, each drained from the sink queue at once.
+            linger (float): In batched mode, seconds to wait for a batch to fill up.
+            interval (float): When set, `transform` is given only the newest item at most once
+                every `interval` seconds.
+            name (str): A name for the transformed feed in `FEEDS`. Defaults to the name of the
+                thread that runs it.
 
         Returns:
             (Feed, Function): The transformed result feed and a function to run the transformation.
 
         """
-        feed_queue = Queue(maxsize=0 if buffer_size is None else buffer_size)
+        feed_queue = _SinkQueue(buffer_size, backpressure)
+        initializer = partial(self._attach, feed_queue)
+
+        if attach_lazy:
+            initializer_fn = initializer
+        else:
+            initializer()
+            initializer_fn = None
+
+        if batch_size is not None:
+            items = feed_queue.batches(batch_size, linger)
+        elif interval is not None:
+            items = feed_queue.samples(interval)
+        else:
+            items = iter(feed_queue)
+        feed = Feed(Feed.__private, transform(items), initializer_fn, feed_queue, name)
+        return feed, feed._run
+
+    @staticmethod
+    def _merge(
+        feeds,
+        transform,
+        buffer_size=1024,
+        attach_lazy=True,
+        backpressure=Backpressure.BLOCK,
+        name=None,
+    ):
+        """Creates a new feed by transforming the items of several feeds, on a single thread.
+
+        Args:
+            feeds (list): The feeds to merge.
+            transform (Function): A function that transforms an iterable of `(index, item)` pairs,
+                where `index` is the position in `feeds` of the feed that produced `item`, into a
+                new iterable.
+            kwargs: As in `_sink`, for the single sink queue shared by all of the feeds, except that
+                the queue is bounded by default and blocks the feeds when full.
+
+        Returns:
+            (Feed, Function): The merged result feed and a function to run the transformation.
+
+        """
+        feed_queue = _MergedQueue(len(feeds), buffer_size, backpressure)
 
         def initializer():
-            if self.__done:
-                feed_queue.put(Feed.__end)
-            else:
-                self.__sinks.append(feed_queue.put_nowait)
+            for i, feed in enumerate(feeds):
+                feed._attach(feed_queue.sink(i))
 
         if attach_lazy:
             initializer_fn = initializer
@@ -84,7 +495,72 @@ class Feed:
             initializer()
             initializer_fn = None
 
-        feed = Feed(Feed.__private, transform(iter(feed_queue.get, Feed.__end)), initializer_fn)
+        items = transform(iter(feed_queue))
+        feed = Feed(Feed.__private, items, initializer_fn, feed_queue, name)
+        return feed, feed._run
+
+    def _attach(self, sink):
+        if self.__done:
+            sink.close()
+        else:
+            self.__sinks.append(sink)
+
+    @staticmethod
+    def combine_latest(feeds, **kwargs):
+        """Returns a feed of tuples of the latest items of `feeds`, with a new tuple every time any
+        of them produces an item once all of them have. It ends when all of `feeds` end.
+
+        Args:
+            feeds (list): The feeds to combine.
+            kwargs: As in `_sink`, for the single sink queue shared by all of the feeds.
+
+        """
+
+        def combine(tagged_items):
+            latest = [None] * len(feeds)
+            missing = set(range(len(feeds)))
+            for i, item in tagged_items:
+                latest[i] = item
+                if missing:
+                    missing.discard(i)
+                    if missing:
+                        continue
+                yield tuple(latest)
+
+        return Feed._merge(feeds, combine, **kwargs)
+
+    @staticmethod
+    def zip(feeds, max_pending=1024, attach_lazy=True, backpressure=Backpressure.BLOCK, name=None):
+        """Returns a feed of tuples of the n-th items of `feeds`. It ends when all of `feeds` end.
+
+        Each feed has a sink queue of its own, read in turn on a single thread, so a feed that runs
+        ahead of the others fills up only its own queue.
+
+        Args:
+            feeds (list): The feeds to zip.
+            max_pending (int): The maximum number of items of each feed held while waiting for the
+                other feeds to catch up, or None for no limit.
+            backpressure (Feed.Backpressure): What to do with new items of a feed that is
+                `max_pending` items ahead. By default the feed waits for the others; any policy
+                that discards items misaligns the tuples that follow.
+            attach_lazy (bool): As in `_sink`.
+            name (str): As in `_sink`.
+
+        """
+        queues = [_SinkQueue(max_pending, backpressure) for _ in feeds]
+
+        def initializer():
+            for feed, queue in zip(feeds, queues):
+                feed._attach(queue)
+
+        if attach_lazy:
+            initializer_fn = initializer
+        else:
+            initializer()
+            initializer_fn = None
+
+        zipped_queues = _ZippedQueues(queues)
+        feed = Feed(Feed.__private, iter(zipped_queues), initializer_fn, zipped_queues, name)
         return feed, feed._run
 
     def map(self, fn, **kwargs):
@@ -93,6 +569,61 @@ class Feed:
     def filter(self, fn, **kwargs):
         return self._sink(partial(filter, fn), **kwargs)
 
+    def pipe(self):
+        """Starts a `Feed.Pipeline` of transformations of this feed, to be run as a single stage."""
+        return Feed.Pipeline(self)
+
+    def batch(self, max_size, linger=0, **kwargs):
+        """Returns a feed of lists of up to `max_size` consecutive items of this feed.
+
+        Args:
+            max_size (int): The maximum number of items in a batch.
+            linger (float): Seconds to wait for a batch to fill up after its first item arrives.
+                Without lingering, a batch holds whatever had accumulated when it was read.
+
+        """
+        return self._sink(iter, batch_size=max_size, linger=linger, **kwargs)
+
+    def window(self, count=None, duration=None, **kwargs):
+        """Returns a feed of lists of consecutive items of this feed, in non-overlapping windows.
+
+        Args:
+            count (int): The maximum number of items in a window.
+            duration (float): When set, the maximum number of seconds from the first item of a
+                window to the last.
+
+        """
+        if duration is not None:
+            max_size = math.inf if count is None else count
+            return self._sink(iter, batch_size=max_size, linger=duration, **kwargs)
+        if count is None:
+            raise Feed.Error("window needs a count or a duration")
+
+        def windows(items):
+            return iter(lambda: list(itertools.islice(items, count)), [])
+
+        return self._sink(windows, **kwargs)
+
+    def throttle(self, interval, **kwargs):
+        """Returns a feed of the items of this feed that come at least `interval` seconds after the
+        previous item it let through."""
+
+        def throttle_items(items):
+            next_at = -math.inf
+            for item in items:
+                now = time.monotonic()
+                if now >= next_at:
+                    next_at = now + interval
+                    yield item
+
+        return self._sink(throttle_items, **kwargs)
+
+    def sample(self, interval, **kwargs):
+        """Returns a feed of the newest item of this feed at most once every `interval` seconds.
+        Items in between are conflated, and the sink queue only ever holds the newest item."""
+        kwargs.setdefault("backpressure", Feed.Backpressure.CONFLATE)
+        return self._sink(iter, interval=interval, **kwargs)
+
     def fold(self, fn, acc, **kwargs):
         """Returns an `MVar` that tracks an accumulation of this feed. If you just want the latest
         accumulator value, prefer the `latest` method.
@@ -122,12 +653,58 @@ class Feed:
         _, runner = self.map(fn, **kwargs)
         return runner
 
+    @property
+    def dropped(self):
+        """The number of items this feed's sink queue has dropped under backpressure."""
+        return 0 if self.__source is None else self.__source.dropped
+
+    @property
+    def conflated(self):
+        """The number of items this feed's sink queue has replaced with newer items."""
+        return 0 if self.__source is None else self.__source.conflated
+
     @property
     def latest(self):
         """Returns the most recent value produced by the iterable. Blocks if no values have been
         produced yet."""
         return self.__latest.read()
 
+    def read_newer(self, version, timeout=None):
+        """Returns the most recent value produced by the iterable and its version, once it is newer
+        than `version`. The n-th value has version n. Blocks until then; see `MVar.read_newer`."""
+        return self.__latest.read_newer(version, timeout)
+
+    @property
+    def name(self):
+        return self.__name
+
+    @property
+    def stats(self):
+        """Runtime counters of this feed.
+
+        `items` counts the items this feed has produced, and `rate_1s`, `rate_10s` and `rate_60s`
+        its throughput in items per second over the last second, 10 seconds and minute. Feeds that
+        transform another feed also report on their sink queue:
+
+            items_in/items_out: Items put into and taken out of the queue.
+            depth/peak_depth: The current and the largest number of items in the queue.
+            lag/max_lag: Seconds from enqueueing to dequeueing, for the latest and slowest item.
+            oldest: Seconds since the oldest item still in the queue was enqueued.
+            dropped/conflated: Items discarded under backpressure.
+
+        """
+        now = time.monotonic()
+        meter = self.__meter
+        stats = {
+            "items": meter.count,
+            "rate_1s": meter.rate(1, now),
+            "rate_10s": meter.rate(10, now),
+            "rate_60s": meter.rate(60, now),
+        }
+        if self.__source is not None:
+            stats.update(self.__source.stats(now))
+        return stats
+
     def _run(self):
         """Runs this feed by pulling elements of the iterable.
 
@@ -135,16 +712,318 @@ class Feed:
         will return a feed alongside its runner. Simply place the runner on its own thread.
 
         """
+        if self.__name is None:
+            self.__name = current_thread().name
+        FEEDS.register(self.__name, self)
         if self.__initializer is not None:
             self.__initializer()
+        latest, sinks, mark = self.__latest, self.__sinks, self.__meter.mark
+        monotonic = time.monotonic
         for item in self.__iterable:
-            self.__latest.swap(item)
-            for sink in self.__sinks:
-                sink(item)
+            latest.swap(item)
+            mark(monotonic())
+            for sink in sinks:
+                sink.put(item)
+        for sink in self.__sinks:
+            sink.close()
+        self.__done = True
+
+
+class FeedRegistry:
+    """Tracks running feeds by name, to snapshot their `Feed.stats`.
+
+    Feeds register themselves when they start running, under their name or otherwise the name of
+    the thread running them. Feeds are held weakly, and a newer feed replaces an older one of the
+    same name.
+
+    """
+
+    def __init__(self):
+        self.__lock = Lock()
+        self.__feeds = WeakValueDictionary()
+
+    def register(self, name, feed):
+        with self.__lock:
+            self.__feeds[name] = feed
+
+    def snapshot(self):
+        """The stats of every registered feed, by name."""
+        with self.__lock:
+            feeds = list(self.__feeds.items())
+        return OrderedDict((name, feed.stats) for name, feed in feeds)
+
+    def dump(self):
+        Log.info("feeds", dict(self.snapshot()))
+
+
+# The registry shared by every feed.
+FEEDS = FeedRegistry()
+
+
+def _aiter(iterable):
+    """Turns an iterable into an async iterable. Sync iterables must not block."""
+    if hasattr(iterable, "__aiter__"):
+        return iterable
+
+    async def generate():
+        for item in iterable:
+            yield item
+
+    return generate()
+
+
+async def _amap(fn, aiterable):
+    async for item in aiterable:
+        result = fn(item)
+        if inspect.isawaitable(result):
+            result = await result
+        yield result
+
+
+async def _afilter(fn, aiterable):
+    async for item in aiterable:
+        keep = fn(item)
+        if inspect.isawaitable(keep):
+            keep = await keep
+        if keep:
+            yield item
+
+
+class _AsyncVar:
+    """An `MVar` for coroutines, whose readers await a value instead of blocking a thread."""
+
+    def __init__(self):
+        self.__value = None
+        self.__ready = asyncio.Event()
+
+    def swap(self, new_value):
+        old_value = self.__value
+        self.__value = new_value
+        self.__ready.set()
+        return old_value
+
+    async def read(self):
+        await self.__ready.wait()
+        return self.__value
+
+
+class AsyncFeed:
+    """A multicast stream type for asyncio, with the operator surface of `Feed`.
+
+    Every stage runs as a coroutine, so any number of feeds and transformations share one event
+    loop and one thread. Runners are coroutine functions to schedule on that loop (e.g. with
+    `asyncio.ensure_future(runner())`), except for the bridges to and from `Feed`, whose runners
+    go on their own threads like any other `Feed` runner.
+
+    `map`, `filter` and `fold` accept plain functions or coroutine functions. Sink queues bounded
+    with `buffer_size` make the parent feed wait for the child to catch up. A feed whose iterable
+    raises ends its children with an `AsyncFeed.Error`, rather than leaving them waiting.
+
+    NOTE: The constructor is private. Use `AsyncFeed.of(iterable)` to construct a feed and its
+    runner.
+
+    """
+
+    class Error(Exception):
+        pass
+
+    # Hacky solution to prevent manual construction.
+    __private = object()
+
+    # Sentinel value for the end of items in a feed.
+    __end = object()
+
+    def __init__(self, private, aiterable, initializer=None):
+        if private != AsyncFeed.__private:
+            raise AsyncFeed.Error("constructor is private")
+        self.__aiterable = aiterable
+        self.__initializer = initializer
+        self.__latest = _AsyncVar()
+        self.__sinks = []
+        self.__done = False
+        self.__error = None
+
+    @staticmethod
+    def of(iterable):
+        """Static constructor for AsyncFeed.
+
+        Args:
+            iterable: An async iterable, or a non-blocking iterable, to initialize the feed from.
+
+        Returns:
+            (AsyncFeed, Function): The feed and a coroutine function to run the feed's iterable.
+
+        """
+        feed = AsyncFeed(AsyncFeed.__private, _aiter(iterable))
+        return (feed, feed._run)
+
+    @staticmethod
+    def from_feed(feed, loop, **kwargs):
+        """Bridges a thread-based `Feed` into an `AsyncFeed` on `loop`.
+
+        Args:
+            feed (Feed): The feed to bridge.
+            loop (AbstractEventLoop): The event loop to run the new feed on.
+            kwargs: Arguments to `Feed._sink` for the bridging sink.
+
+        Returns:
+            (AsyncFeed, Function): The new feed and a function to run the bridge on its own thread.
+
+        """
+        async_feed = AsyncFeed(AsyncFeed.__private, None)
+
+        def call(coroutine):
+            # Waiting on each item carries the async feed's backpressure over to the thread.
+            asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+        def forward(items):
+            for item in items:
+                call(async_feed._publish(item))
+            call(async_feed._close())
+            yield from ()
+
+        _, runner = feed._sink(forward, **kwargs)
+        return async_feed, runner
+
+    def to_feed(self, loop, **kwargs):
+        """Bridges this feed into a thread-based `Feed`.
+
+        Args:
+            loop (AbstractEventLoop): The event loop this feed runs on.
+            kwargs: Arguments to `_sink` for the bridging sink.
+
+        Returns:
+            (Feed, Function): The new feed and a function to run the bridge on its own thread.
+
+        """
+        feed_queue = _SinkQueue(None, Feed.Backpressure.RAISE)
+        subscription = self.subscribe(feed_queue.put, **kwargs)
+        feed, feed_runner = Feed.of(iter(feed_queue))
+
+        async def forward():
+            try:
+                await subscription()
+            finally:
+                feed_queue.close()
+
+        def runner():
+            future = asyncio.run_coroutine_threadsafe(forward(), loop)
+            feed_runner()
+            # Raise any error from the subscription on this thread, or it would pass for an end.
+            future.result()
+
+        return feed, runner
+
+    def _sink(self, transform, buffer_size=None, attach_lazy=True):
+        """Creates a new feed by transforming the async iterable of this feed.
+
+        Prefer calling `map`, `filter`, or any of the other specialized versions of this method.
+
+        Args:
+            transform (Function): A function that transforms an async iterable into a new one.
+            buffer_size (int): An argument to bound the size of the sink queue.
+            attach_lazy (bool): When True, items will not be placed in the sink queue until the
+                transformed feed is actually run.
+
+        Returns:
+            (AsyncFeed, Function): The transformed feed and a coroutine function to run it.
+
+        """
+        feed_queue = asyncio.Queue(maxsize=0 if buffer_size is None else buffer_size)
+
+        def initializer():
+            if self.__done:
+                feed_queue.put_nowait(self.__end_item())
+            else:
+                self.__sinks.append(feed_queue)
+
+        if attach_lazy:
+            initializer_fn = initializer
+        else:
+            initializer()
+            initializer_fn = None
+
+        async def items():
+            while True:
+                item = await feed_queue.get()
+                if item is AsyncFeed.__end:
+                    return
+                if isinstance(item, BaseException):
+                    raise AsyncFeed.Error("parent feed failed") from item
+                yield item
+
+        feed = AsyncFeed(AsyncFeed.__private, transform(items()), initializer_fn)
+        return feed, feed._run
+
+    def map(self, fn, **kwargs):
+        return self._sink(partial(_amap, fn), **kwargs)
+
+    def filter(self, fn, **kwargs):
+        return self._sink(partial(_afilter, fn), **kwargs)
+
+    def fold(self, fn, acc, **kwargs):
+        """Tracks an accumulation of this feed, like `Feed.fold`.
+
+        Returns:
+            (_AsyncVar, Function): A variable whose `read` coroutine returns the latest accumulator
+                value, and a coroutine function to run the accumulation.
+
+        """
+        current_acc = acc
+        acc_var = _AsyncVar()
+
+        async def update(item):
+            nonlocal current_acc
+            current_acc = fn(item, current_acc)
+            if inspect.isawaitable(current_acc):
+                current_acc = await current_acc
+            acc_var.swap(current_acc)
+
+        _, runner = self._sink(partial(_amap, update), **kwargs)
+        return acc_var, runner
+
+    def subscribe(self, fn, **kwargs):
+        """A specialized version of `map` that discards the result feed."""
+        _, runner = self.map(fn, **kwargs)
+        return runner
+
+    @property
+    def latest(self):
+        """An awaitable of the most recent value produced by the iterable. Waits if no values have
+        been produced yet."""
+        return self.__latest.read()
+
+    async def _publish(self, item):
+        self.__latest.swap(item)
         for sink in self.__sinks:
-            sink(Feed.__end)
+            await sink.put(item)
+
+    async def _close(self, error=None):
+        self.__error = error
+        for sink in self.__sinks:
+            await sink.put(self.__end_item())
         self.__done = True
 
+    def __end_item(self):
+        return AsyncFeed.__end if self.__error is None else self.__error
+
+    async def _run(self):
+        """Runs this feed by pulling elements of the async iterable.
+
+        NOTE: Do not call this function directly; the static constructor and every transformation
+        will return a feed alongside its runner. Schedule the runner on the event loop.
+
+        """
+        if self.__initializer is not None:
+            self.__initializer()
+        try:
+            async for item in self.__aiterable:
+                await self._publish(item)
+        except Exception as error:
+            await self._close(error)
+            raise
+        await self._close()
+
 
 def test_feed_simple():
     """Tests the basic functions of `Feed`."""
@@ -175,15 +1054,12 @@ def test_feed_lazy():
     """Tests the difference between lazy and live attachment of children feeds.
 
     TODO: Make this less jank by allowing the runner threads to be explicitly cancelled (this
-    requires some thread plumbing). For now the busy waiting strategy should work fine.
+    requires some thread plumbing).
 
     """
-    lazy_results = []
-    live_results = []
-
     feed, runner = Feed.of(itertools.count())
-    runner_lazy = feed.subscribe(lazy_results.append)
-    runner_live = feed.subscribe(live_results.append, attach_lazy=False)
+    lazy_feed, runner_lazy = feed.map(lambda x: x)
+    live_feed, runner_live = feed.map(lambda x: x, attach_lazy=False)
 
     runner_thread = Thread(target=runner, daemon=True)
     runner_lazy_thread = Thread(target=runner_lazy, daemon=True)
@@ -191,17 +1067,16 @@ def test_feed_lazy():
 
     runner_thread.start()
     runner_live_thread.start()
-
-    while len(live_results) == 0:
-        time.sleep(0.01)
+    live_value, live_version = live_feed.read_newer(0)
 
     runner_lazy_thread.start()
+    lazy_value, lazy_version = lazy_feed.read_newer(0)
 
-    while len(lazy_results) == 0:
-        time.sleep(0.01)
-
-    assert live_results[0] == 0
-    assert lazy_results[0] > live_results[0]
+    # The n-th item of each feed has version n, which dates its first item.
+    live_first = live_value - live_version + 1
+    lazy_first = lazy_value - lazy_version + 1
+    assert live_first == 0
+    assert lazy_first > live_first
 
 
 def test_feed_dead():
@@ -236,3 +1111,300 @@ def test_feed_buffer_size():
     thread_manager = ThreadManager()
     thread_manager.attach("feed-runner", feed_runner, should_terminate=True)
     thread_manager.run()
+
+
+def test_feed_backpressure():
+    """Tests each backpressure policy against a reader that starts after the writer is done."""
+    feed, runner = Feed.of(range(100))
+    policies = [
+        Feed.Backpressure.DROP_OLDEST,
+        Feed.Backpressure.DROP_NEWEST,
+        Feed.Backpressure.CONFLATE,
+    ]
+    sinks = []
+    for policy in policies:
+        sink, sink_runner = feed.map(
+            lambda x: x, buffer_size=10, backpressure=policy, attach_lazy=False
+        )
+        results = []
+        results_runner = sink.subscribe(results.append, attach_lazy=False)
+        sinks.append((sink, sink_runner, results_runner, results))
+    runner()
+    for _, sink_runner, results_runner, _ in sinks:
+        sink_runner()
+        results_runner()
+
+    assert [results for _, _, _, results in sinks] == [list(range(90, 100)), list(range(10)), [99]]
+    assert [sink.dropped for sink, _, _, _ in sinks] == [90, 90, 0]
+    assert [sink.conflated for sink, _, _, _ in sinks] == [0, 0, 99]
+
+    # A blocking sink holds the writer back until it is read.
+    feed, runner = Feed.of(range(100))
+    blocking_feed, blocking_runner = feed.map(
+        lambda x: x, buffer_size=10, backpressure=Feed.Backpressure.BLOCK, attach_lazy=False
+    )
+    results = []
+    results_runner = blocking_feed.subscribe(results.append, attach_lazy=False)
+    writer_thread = Thread(target=runner)
+    writer_thread.start()
+    time.sleep(0.05)
+    assert writer_thread.is_alive()
+    blocking_runner()
+    results_runner()
+    writer_thread.join()
+    assert results == list(range(100)) and blocking_feed.dropped == 0
+
+
+def test_feed_batch():
+    """Tests batched sinks and the `batch` operator, with and without lingering."""
+    feed, runner = Feed.of(range(1000))
+    batches, batches_runner = feed.batch(64, attach_lazy=False)
+    sizes, sizes_runner = feed.map(len, batch_size=100, attach_lazy=False)
+    results = []
+    results_runner = batches.subscribe(results.append, attach_lazy=False)
+    total = sizes.fold(lambda size, acc: acc + size, 0, attach_lazy=False)
+    runner()
+    for sink_runner in [batches_runner, results_runner, sizes_runner, total[1]]:
+        sink_runner()
+    assert [x for batch in results for x in batch] == list(range(1000))
+    assert [len(batch) for batch in results] == [64] * 15 + [40]
+    assert total[0].read() == 1000
+
+    # A lingering batch waits for a slow writer to fill it.
+    def slow_range():
+        for i in range(5):
+            time.sleep(0.01)
+            yield i
+
+    feed, runner = Feed.of(slow_range())
+    batches, batches_runner = feed.batch(100, linger=0.5, attach_lazy=False)
+    results = []
+    results_runner = batches.subscribe(results.append, attach_lazy=False)
+    writer_thread = Thread(target=runner)
+    writer_thread.start()
+    batches_runner()
+    results_runner()
+    writer_thread.join()
+    assert results == [[0, 1, 2, 3, 4]]
+
+
+def test_feed_pipeline():
+    """Tests that a fused pipeline matches the equivalent chain of transformations, and that the
+    feed it produces is multicast."""
+    feed, runner = Feed.of(range(1000))
+    pipeline = feed.pipe().map(lambda x: x * 3).filter(lambda x: x % 2 == 0)
+    evens, evens_runner = pipeline.feed(attach_lazy=False)
+    total, total_runner = pipeline.map(lambda x: x + 1).fold(
+        lambda item, acc: acc + item, 0, attach_lazy=False
+    )
+    strs, strs_runner = evens.map(str, attach_lazy=False)
+    results_a, results_b = [], []
+    runner_a = evens.subscribe(results_a.append, attach_lazy=False)
+    runner_b = strs.pipe().subscribe(results_b.append, attach_lazy=False)
+
+    thread_manager = ThreadManager()
+    for name, fn in [
+        ("feed", runner),
+        ("evens", evens_runner),
+        ("total", total_runner),
+        ("strs", strs_runner),
+        ("results_a", runner_a),
+        ("results_b", runner_b),
+    ]:
+        thread_manager.attach(name, fn, should_terminate=True)
+    thread_manager.run()
+
+    expected = [x * 3 for x in range(1000) if x * 3 % 2 == 0]
+    assert results_a == expected
+    assert results_b == [str(x) for x in expected]
+    assert total.read() == sum(x + 1 for x in expected)
+    assert evens.latest == expected[-1]
+
+
+def test_feed_combinators():
+    """Tests `combine_latest`, `zip`, `window`, `throttle` and `sample` by running each stage to
+    completion in turn on this thread."""
+    letters, letters_runner = Feed.of("abc")
+    numbers, numbers_runner = Feed.of(range(4))
+    combined, combined_runner = Feed.combine_latest([letters, numbers], attach_lazy=False)
+    zipped, zipped_runner = Feed.zip([letters, numbers], attach_lazy=False)
+    windows, windows_runner = numbers.window(count=3, attach_lazy=False)
+    throttled, throttled_runner = numbers.throttle(60, attach_lazy=False)
+    sampled, sampled_runner = numbers.sample(60, attach_lazy=False)
+    runners = [letters_runner, numbers_runner]
+    results = {}
+    for name, feed, runner in [
+        ("combined", combined, combined_runner),
+        ("zipped", zipped, zipped_runner),
+        ("windows", windows, windows_runner),
+        ("throttled", throttled, throttled_runner),
+        ("sampled", sampled, sampled_runner),
+    ]:
+        results[name] = []
+        runners += [runner, feed.subscribe(results[name].append, attach_lazy=False)]
+    for runner in runners:
+        runner()
+
+    assert results["combined"] == [("c", i) for i in range(4)]
+    assert results["zipped"] == [("a", 0), ("b", 1), ("c", 2)]
+    assert results["windows"] == [[0, 1, 2], [3]]
+    assert results["throttled"] == [0]
+    assert results["sampled"] == [3]
+    assert sampled.conflated == 3
+
+
+def test_feed_zip_backpressure():
+    """Tests that a feed running ahead of the others in a `zip` waits for them within
+    `max_pending` items, or raises under `Feed.Backpressure.RAISE`, and never misaligns."""
+    from queue import Queue
+
+    fast, fast_runner = Feed.of(range(100))
+    slow_items = Queue()
+    slow, slow_runner = Feed.of(iter(slow_items.get, None))
+    zipped, zipped_runner = Feed.zip([fast, slow], max_pending=4, attach_lazy=False)
+    results = []
+    results_runner = zipped.subscribe(results.append, attach_lazy=False)
+
+    thread_manager = ThreadManager()
+    for name, runner in [
+        ("zip-fast", fast_runner),
+        ("zip-slow", slow_runner),
+        ("zip", zipped_runner),
+        ("zip-results", results_runner),
+    ]:
+        thread_manager.attach(name, runner, should_terminate=True)
+
+    def slow_source():
+        # The fast feed is blocked on its full queue until the slow feed catches up.
+        while zipped.stats["depth"] < 4:
+            time.sleep(0.01)
+        time.sleep(0.05)
+        # Four items are queued, and the zip holds one more while it waits on the slow feed.
+        assert zipped.stats["items_in"] == 5
+        for i in range(100):
+            slow_items.put(-i)
+        slow_items.put(None)
+
+    thread_manager.attach("zip-slow-source", slow_source, should_terminate=True)
+    thread_manager.run()
+    assert results == [(i, -i) for i in range(100)]
+    assert zipped.stats["peak_depth"] <= 4 and zipped.dropped == 0
+
+    fast, fast_runner = Feed.of(range(10))
+    slow, _ = Feed.of([])
+    Feed.zip([fast, slow], max_pending=2, attach_lazy=False, backpressure=Feed.Backpressure.RAISE)
+    try:
+        fast_runner()
+        assert False
+    except Full:
+        pass
+
+
+def test_feed_stats():
+    """Tests feed counters, and that feeds register under the names of their threads."""
+    feed, runner = Feed.of(range(100))
+    slow, slow_runner = feed.map(lambda x: x, attach_lazy=False)
+    thread_manager = ThreadManager()
+    thread_manager.attach("stats-source", runner, should_terminate=True)
+    thread_manager.run()
+
+    stats = slow.stats
+    assert stats["items"] == 0 and stats["items_in"] == 100 and stats["items_out"] == 0
+    assert stats["depth"] == stats["peak_depth"] == 100 and stats["oldest"] > 0
+
+    slow_runner()
+    stats = slow.stats
+    assert stats["items"] == stats["items_out"] == 100 and stats["rate_60s"] > 0
+    assert stats["depth"] == 0 and stats["peak_depth"] == 100
+    assert 0 < stats["lag"] <= stats["max_lag"]
+
+    snapshot = FEEDS.snapshot()
+    assert snapshot["stats-source"]["items"] == 100
+    assert snapshot["MainThread"]["items_out"] == 100
+
+
+def test_async_feed():
+    """Tests the basic functions of `AsyncFeed`, mirroring `test_feed_simple`."""
+
+    async def main():
+        feed, runner = AsyncFeed.of(range(1000))
+        feed_even, runner_even = feed.filter(lambda x: x % 2 == 0, attach_lazy=False)
+        aggregate, runner_aggregate = feed_even.fold(
+            lambda item, acc: acc + item, 0, attach_lazy=False
+        )
+
+        async def to_str(x):
+            return str(x)
+
+        feed_even_str, runner_str = feed_even.map(to_str, attach_lazy=False)
+        results = []
+        runner_results = feed_even_str.subscribe(results.append, attach_lazy=False)
+
+        await asyncio.gather(
+            runner(), runner_even(), runner_aggregate(), runner_str(), runner_results()
+        )
+        assert await aggregate.read() == sum(range(0, 1000, 2))
+        assert results == [str(i) for i in range(0, 1000, 2)]
+        assert await feed_even.latest == 998
+
+        # Lazy attachment to a finished feed ends immediately.
+        late_results = []
+        await feed.subscribe(late_results.append)()
+        assert late_results == []
+
+    asyncio.run(main())
+
+
+def test_async_feed_bridge():
+    """Tests bridging a `Feed` through an `AsyncFeed` and back."""
+    loop = asyncio.new_event_loop()
+    loop_thread = Thread(target=loop.run_forever, daemon=True)
+    loop_thread.start()
+
+    feed, runner = Feed.of(range(100))
+    async_feed, bridge_in = AsyncFeed.from_feed(feed, loop, attach_lazy=False)
+    doubled, async_runner = async_feed.map(lambda x: 2 * x, attach_lazy=False)
+    result_feed, bridge_out = doubled.to_feed(loop, attach_lazy=False)
+    results = []
+    results_runner = result_feed.subscribe(results.append, attach_lazy=False)
+
+    asyncio.run_coroutine_threadsafe(async_runner(), loop)
+    thread_manager = ThreadManager()
+    for name, fn in [
+        ("feed", runner),
+        ("bridge-in", bridge_in),
+        ("bridge-out", bridge_out),
+        ("results", results_runner),
+    ]:
+        thread_manager.attach(name, fn, should_terminate=True)
+    thread_manager.run()
+    loop.call_soon_threadsafe(loop.stop)
+
+    assert results == [2 * x for x in range(100)]
+
+
+def test_async_feed_bridge_failure():
+    """Tests that a failing `AsyncFeed` fails its bridge to `Feed`, instead of just ending it."""
+    loop = asyncio.new_event_loop()
+    loop_thread = Thread(target=loop.run_forever, daemon=True)
+    loop_thread.start()
+
+    async def failing():
+        yield 1
+        raise ValueError("failing")
+
+    async_feed, async_runner = AsyncFeed.of(failing())
+    _, bridge_out = async_feed.to_feed(loop, attach_lazy=False)
+
+    source = asyncio.run_coroutine_threadsafe(async_runner(), loop)
+    thread_manager = ThreadManager()
+    thread_manager.attach("bridge-out", bridge_out, should_terminate=True)
+    try:
+        thread_manager.run()
+        assert False
+    except ThreadManager.Error:
+        pass
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+
+    assert isinstance(source.exception(), ValueError)
@@ -0,0 +1,316 @@
+"""The `shared_feed` module.
+
+Feeds of fixed-layout records across processes, over ring buffers in shared memory.
+
+"""
+
+import os
+import sys
+import time
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from trader.util.feed import Feed
+
+# Header fields, as int64 offsets into the start of the shared memory.
+_CAPACITY = 0
+_RECORD_SIZE = 1
+_WRITTEN = 2
+_CLOSED = 3
+_HEADER_SIZE = 8 * 4
+
+# The sequence number of a slot that is being written.
+_WRITING = -1
+
+# Names of the shared memory created by this process.
+_created = set()
+
+
+class SharedRing:
+    """A ring buffer of records in shared memory, with one writer and any number of readers in any
+    number of processes.
+
+    Records have a fixed layout given by a numpy dtype, e.g. a top of book, a trade or a row of a
+    frame, which every process must agree on. The writer never waits for readers: each record gets
+    the next sequence number and overwrites the oldest slot. Readers poll for new records and
+    validate each copy against its slot's sequence number, so a reader that falls more than a
+    capacity behind skips ahead to the oldest record still available, counting the records it
+    missed as `dropped`.
+
+    NOTE: The constructor is private. Use `SharedRing.create` in the writer's process and
+    `SharedRing.attach` in the readers'.
+
+    """
+
+    class Error(Exception):
+        pass
+
+    # Hacky solution to prevent manual construction.
+    __private = object()
+
+    def __init__(self, private, shm, dtype, owner):
+        if private != SharedRing.__private:
+            raise SharedRing.Error("constructor is private")
+        self.__shm = shm
+        self.__dtype = np.dtype(dtype)
+        self.__owner = owner
+        self.__header = np.ndarray((_HEADER_SIZE // 8,), dtype=np.int64, buffer=shm.buf)
+        capacity, record_size = self.__header[_CAPACITY], self.__header[_RECORD_SIZE]
+        if record_size != self.__dtype.itemsize:
+            del self.__header
+            shm.close()
+            raise SharedRing.Error("record dtype does not match the ring buffer")
+        slot_dtype = np.dtype([("seq", np.int64), ("record", self.__dtype)])
+        self.__slots = np.ndarray(
+            (capacity,), dtype=slot_dtype, buffer=shm.buf, offset=_HEADER_SIZE
+        )
+        self.__seqs = self.__slots["seq"]
+        self.__records = self.__slots["record"]
+        self.dropped = 0
+
+    @staticmethod
+    def create(name, dtype, capacity=4096):
+        """Creates a ring buffer to write to.
+
+        Args:
+            name (str): The system-wide name of the shared memory.
+            dtype (dtype): The layout of a record.
+            capacity (int): The number of records in the ring buffer.
+
+        Returns:
+            SharedRing: The ring buffer.
+
+        """
+        dtype = np.dtype(dtype)
+        size = _HEADER_SIZE + capacity * (8 + dtype.itemsize)
+        shm = SharedMemory(name=name, create=True, size=size)
+        _created.add(shm.name)
+        header = np.ndarray((_HEADER_SIZE // 8,), dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[_CAPACITY] = capacity
+        header[_RECORD_SIZE] = dtype.itemsize
+        del header
+        ring = SharedRing(SharedRing.__private, shm, dtype, True)
+        ring.__seqs[:] = _WRITING
+        return ring
+
+    @staticmethod
+    def attach(name, dtype):
+        """Attaches to a ring buffer created by another process, to read from.
+
+        Args:
+            name (str): The system-wide name of the shared memory.
+            dtype (dtype): The layout of a record.
+
+        Returns:
+            SharedRing: The ring buffer.
+
+        """
+        # Only the writer's process should unlink the shared memory when it exits, so readers in
+        # other processes keep it out of their resource trackers.
+        if name in _created:
+            shm = SharedMemory(name=name)
+        elif sys.version_info >= (3, 13):
+            shm = SharedMemory(name=name, track=False)
+        else:
+            shm = SharedMemory(name=name)
+            if os.name == "posix":
+                # The tracker registers POSIX shared memory under its name with a leading slash.
+                resource_tracker.unregister("/" + shm.name, "shared_memory")
+        return SharedRing(SharedRing.__private, shm, dtype, False)
+
+    @property
+    def name(self):
+        return self.__shm.name
+
+    @property
+    def written(self):
+        """The number of records written so far, which is also the next sequence number."""
+        return int(self.__header[_WRITTEN])
+
+    def put(self, record):
+        """Writes a record. Only the process that created the ring buffer may write to it.
+
+        Args:
+            record: A tuple or numpy record in the layout of the ring buffer.
+
+        """
+        seq = self.__header[_WRITTEN]
+        slot = seq % len(self.__slots)
+        self.__seqs[slot] = _WRITING
+        self.__records[slot] = record
+        self.__seqs[slot] = seq
+        self.__header[_WRITTEN] = seq + 1
+
+    def close(self):
+        """Marks the end of the records. Readers stop once they have read every record."""
+        self.__header[_CLOSED] = 1
+
+    def release(self):
+        """Releases this process's mapping of the shared memory, and removes the shared memory if
+        this process created it. Records that were read remain valid."""
+        del self.__header, self.__slots, self.__seqs, self.__records
+        self.__shm.close()
+        if self.__owner:
+            self.__shm.unlink()
+            _created.discard(self.__shm.name)
+
+    def read(self, start=None, spin=0.001, poll_interval=0.0005):
+        """Yields records as they are written, as copies, until the ring buffer is closed.
+
+        Records that are already available when the reader gets to them are copied in one batch,
+        so that a reader that has fallen behind catches up quickly.
+
+        Args:
+            start (int): The sequence number to start from. Defaults to the next record written;
+                0 starts from the oldest record still available.
+            spin (float): Seconds to busy-wait for a new record before sleeping. Spinning keeps
+                the handoff down to microseconds while records keep coming.
+            poll_interval (float): Seconds to sleep between polls once done spinning. An idle
+                reader wakes up this often for as long as the ring buffer stays open, so a longer
+                interval saves CPU at the cost of latency on the first record after a lull.
+
+        """
+        header, seqs, records = self.__header, self.__seqs, self.__records
+        capacity = len(records)
+        written = int(header[_WRITTEN])
+        seq = written if start is None else start
+        idle_since = None
+        while True:
+            if seq >= written:
+                # Only poll the header once every record known to be written has been read.
+                written = int(header[_WRITTEN])
+                if seq < written:
+                    idle_since = None
+                elif header[_CLOSED] and seq >= header[_WRITTEN]:
+                    return
+                elif idle_since is None:
+                    idle_since = time.monotonic()
+                    continue
+                elif time.monotonic() - idle_since > spin:
+                    time.sleep(poll_interval)
+                    continue
+                else:
+                    continue
+            # Copy every available record up to the end of the ring at once. The writer overwrites
+            # slots in order, so if the first slot is intact after the copy, all of them are.
+            slot = seq % capacity
+            count = min(written - seq, capacity - slot)
+            batch = records[slot : slot + count].copy()
+            if seqs[slot] != seq:
+                # The writer has lapped this reader, so skip to the oldest record still available.
+                written = int(header[_WRITTEN])
+                oldest = written - capacity
+                if seq < oldest:
+                    self.dropped += oldest - seq
+                    seq = oldest
+                continue
+            seq += count
+            yield from batch
+
+    def feed(self, **kwargs):
+        """Returns a feed of the records written to this ring buffer.
+
+        Args:
+            kwargs: Arguments to `read`.
+
+        Returns:
+            (Feed, Function): The feed and a function to run it.
+
+        """
+        return Feed.of(self.read(**kwargs))
+
+    def publish(self, feed, **kwargs):
+        """Writes every item of `feed`, as records, to this ring buffer.
+
+        Args:
+            feed (Feed): A feed of tuples or numpy records in the layout of the ring buffer.
+            kwargs: Arguments to `Feed.subscribe`.
+
+        Returns:
+            Function: A function to run the publication, which closes the ring buffer once `feed`
+                ends.
+
+        """
+        runner = feed.subscribe(self.put, **kwargs)
+
+        def publish():
+            runner()
+            self.close()
+
+        return publish
+
+
+_TEST_DTYPE = [("bid", np.float64), ("ask", np.float64), ("seq", np.int64)]
+
+# Prints the bids of a ring buffer from another process.
+_TEST_READER = """
+import sys
+from trader.util.shared_feed import SharedRing, _TEST_DTYPE
+
+ring = SharedRing.attach(sys.argv[1], _TEST_DTYPE)
+feed, runner = ring.feed(start=0)
+bids = []
+pipeline = feed.pipe().map(lambda record: int(record["bid"]))
+runner_bids = pipeline.subscribe(bids.append, attach_lazy=False)
+runner()
+runner_bids()
+print(bids)
+ring.release()
+"""
+
+
+def test_shared_ring():
+    """Tests reading a ring buffer, including after the writer laps the reader."""
+    ring = SharedRing.create(f"test-ring-{time.monotonic_ns()}", _TEST_DTYPE, capacity=8)
+    reader = SharedRing.attach(ring.name, _TEST_DTYPE)
+    try:
+        for i in range(20):
+            ring.put((i, i + 1, i))
+        ring.close()
+        records = list(reader.read(start=0))
+        assert [r["seq"] for r in records] == list(range(12, 20))
+        assert records[-1]["ask"] == 20.0 and reader.dropped == 12
+        assert ring.written == 20
+        try:
+            SharedRing.attach(ring.name, [("bid", np.float64)])
+            assert False
+        except SharedRing.Error:
+            pass
+    finally:
+        reader.release()
+        ring.release()
+
+
+def test_shared_feed_across_processes():
+    """Tests publishing a feed to a subscriber in another process."""
+    import os
+    import subprocess
+    import sys
+
+    from trader.util.thread import ThreadManager
+
+    ring = SharedRing.create(f"test-feed-{time.monotonic_ns()}", _TEST_DTYPE, capacity=1024)
+    try:
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        subscriber = subprocess.Popen(
+            [sys.executable, "-c", _TEST_READER, ring.name],
+            cwd=root,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        feed, runner = Feed.of(range(500))
+        records, runner_records = feed.map(lambda x: (x, x + 1, x), attach_lazy=False)
+        thread_manager = ThreadManager()
+        thread_manager.attach("feed", runner, should_terminate=True)
+        thread_manager.attach("records", runner_records, should_terminate=True)
+        publish = ring.publish(records, attach_lazy=False)
+        thread_manager.attach("publish", publish, should_terminate=True)
+        thread_manager.run()
+        output, _ = subscriber.communicate(timeout=60)
+        assert subscriber.returncode == 0
+        assert output.strip() == str(list(range(500)))
+    finally:
+        ring.release()
@@ -7,20 +7,101 @@ Note: In literature on moving averages, you'll see "value" referred to as "level
 """
 
 import numpy as np
+import pandas as pd
+from numpy_ringbuffer import RingBuffer
+from scipy.signal import lfilter
+
+
+def _as_array(X):
+    return np.asarray(X, dtype=np.float64)
+
+
+def _like(X, path):
+    """Labels an output path like the observations it was computed from."""
+    if isinstance(X, pd.DataFrame):
+        return pd.DataFrame(path, index=X.index, columns=X.columns)
+    return path
+
+
+def _row_like(X, row):
+    """Labels a single state row like a row of the observations."""
+    if isinstance(X, pd.DataFrame):
+        return pd.Series(row, index=X.columns)
+    return row
+
+
+def _read_only(array):
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+def _initial_conditions(X, *rows):
+    """Builds an `lfilter` initial state of the right shape for the observations `X`."""
+    zi = np.empty((len(rows),) + X.shape[1:])
+    for i, row in enumerate(rows):
+        zi[i] = row
+    return zi
+
+
+def _ema_filter(a, gain, X, value):
+    """Runs `y_t = a * y_{t-1} + gain * X_t` down the first axis of `X`, starting from `value`."""
+    return lfilter([gain], [1, -a], X, axis=0, zi=_initial_conditions(X, a * _as_array(value)))[0]
+
+
+def _holt_filter(a, b, X, value, trend):
+    """Runs Holt's linear smoothing down the first axis of `X`, starting from `value` and `trend`.
+
+    Value and trend form a linear system `s_t = A s_{t-1} + B x_t`, so each is the output of a
+    second order recursive filter whose initial conditions follow from the current state (the
+    second one by Cayley-Hamilton).
+
+    Returns:
+        (ndarray, ndarray): The paths of values and trends.
+
+    """
+    value = _as_array(value)
+    trend = _as_array(trend)
+    A = np.array([[a, a], [(1 - b) * (a - 1), b + a * (1 - b)]])
+    B = np.array([1 - a, (1 - b) * (1 - a)])
+    denominator = [1, -np.trace(A), np.linalg.det(A)]
+    # Apply the state transition once to get the zero-input response of the next step.
+    next_value = A[0, 0] * value + A[0, 1] * trend
+    next_trend = A[1, 0] * value + A[1, 1] * trend
+    values = lfilter(
+        [B[0], A[0, 1] * B[1] - A[1, 1] * B[0]],
+        denominator,
+        X,
+        axis=0,
+        zi=_initial_conditions(X, next_value, -denominator[2] * value),
+    )[0]
+    trends = lfilter(
+        [B[1], A[1, 0] * B[0] - A[0, 0] * B[1]],
+        denominator,
+        X,
+        axis=0,
+        zi=_initial_conditions(X, next_trend, -denominator[2] * trend),
+    )[0]
+    return values, trends
 
 
 class Ema:
     """
     Exponentially-weighted moving average.
+
+    With `in_place` set, the value is held in a preallocated float64 array that `step` updates with
+    `out=` ufuncs, and readers get a read-only view of it.
     """
 
-    def __init__(self, half_life, value_0=None):
+    def __init__(self, half_life, value_0=None, in_place=False):
         self.__a = 0.5 ** (1 / half_life)
+        self.__in_place = in_place
+        self.__view = None
+        self.__value = None
         if value_0 is None:
-            self.__value = None
             self.__samples_needed = half_life
         else:
-            self.__value = value_0
+            self.__set_value(value_0)
             self.__samples_needed = 0
 
     @property
@@ -29,15 +110,58 @@ class Ema:
 
     @property
     def value(self):
-        return self.__value
+        return self.__view if self.__in_place else self.__value
+
+    def __set_value(self, value):
+        if not self.__in_place:
+            self.__value = value
+        elif self.__view is None:
+            self.__value = np.array(value, dtype=np.float64)
+            self.__scratch = np.empty_like(self.__value)
+            self.__view = _read_only(self.__value)
+        else:
+            np.copyto(self.__value, value)
 
     def step(self, x):
+        if self.__in_place:
+            return self.__step_in_place(x)
         if self.__value is None:
             self.__value = x
         self.__value = self.__a * self.__value + (1 - self.__a) * x
         self.__samples_needed = max(0, self.__samples_needed - 1)
         return self.__value
 
+    def __step_in_place(self, x):
+        x = np.asarray(x)
+        if self.__view is None:
+            self.__set_value(x)
+        self.__value *= self.__a
+        np.multiply(1 - self.__a, x, out=self.__scratch)
+        self.__value += self.__scratch
+        self.__samples_needed = max(0, self.__samples_needed - 1)
+        return self.__view
+
+    def step_many(self, X):
+        """Steps through the rows of `X` in one vectorized pass.
+
+        Equivalent to calling `step` on every row of `X` in order.
+
+        Args:
+            X: A 2D array or DataFrame with one row per observation.
+
+        Returns:
+            The path of values, one row per observation.
+
+        """
+        values = _as_array(X)
+        if len(values) == 0:
+            return _like(X, values)
+        value = values[0] if self.__value is None else self.__value
+        path = _ema_filter(self.__a, 1 - self.__a, values, value)
+        self.__set_value(_row_like(X, path[-1]))
+        self.__samples_needed = max(0, self.__samples_needed - len(values))
+        return _like(X, path)
+
     @property
     def ready(self):
         return self.__samples_needed == 0
@@ -46,10 +170,15 @@ class Ema:
 class Emse:
     """
     Exponentially-weighted moving mean squared-erroer.
+
+    With `in_place` set, the mse is held in a preallocated float64 array that `step` updates with
+    `out=` ufuncs, and readers get a read-only view of it.
     """
 
-    def __init__(self, half_life, mse_0=None):
+    def __init__(self, half_life, mse_0=None, in_place=False):
         self.__a = 0.5 ** (1 / half_life)
+        self.__in_place = in_place
+        self.__view = None
         if mse_0 is None:
             self.__mse = 0
             self.__samples_needed = half_life
@@ -59,17 +188,60 @@ class Emse:
 
     @property
     def mse(self):
-        return self.__mse
+        return self.__mse if self.__view is None else self.__view
 
     @property
     def stderr(self):
         return np.sqrt(self.__mse)
 
+    def __set_mse(self, mse):
+        if not self.__in_place:
+            self.__mse = mse
+        elif self.__view is None:
+            self.__mse = np.array(mse, dtype=np.float64)
+            self.__scratch = np.empty_like(self.__mse)
+            self.__view = _read_only(self.__mse)
+        else:
+            np.copyto(self.__mse, mse)
+
     def step(self, e):
+        if self.__in_place:
+            return self.__step_in_place(e)
         self.__mse = self.__a * (self.__mse + (1 - self.__a) * e ** 2)
         self.__samples_needed = max(0, self.__samples_needed - 1)
         return self.__mse
 
+    def __step_in_place(self, e):
+        e = np.asarray(e)
+        if self.__view is None:
+            self.__set_mse(np.broadcast_to(self.__mse, e.shape))
+        np.square(e, out=self.__scratch)
+        self.__scratch *= 1 - self.__a
+        self.__mse += self.__scratch
+        self.__mse *= self.__a
+        self.__samples_needed = max(0, self.__samples_needed - 1)
+        return self.__view
+
+    def step_many(self, E):
+        """Steps through the rows of `E` in one vectorized pass.
+
+        Equivalent to calling `step` on every row of `E` in order.
+
+        Args:
+            E: A 2D array or DataFrame of errors with one row per observation.
+
+        Returns:
+            The path of mean squared-errors, one row per observation.
+
+        """
+        errors = _as_array(E)
+        if len(errors) == 0:
+            return _like(E, errors)
+        path = _ema_filter(self.__a, self.__a * (1 - self.__a), errors ** 2, self.__mse)
+        self.__set_mse(_row_like(E, path[-1]))
+        self.__samples_needed = max(0, self.__samples_needed - len(errors))
+        return _like(E, path)
+
     @property
     def ready(self):
         return self.__samples_needed == 0
@@ -79,10 +251,13 @@ class HoltEma:
     """
     Holt's linear exponential smoothing, with optional moving mean squared-error.
 
+    With `in_place` set, value, trend and mse are held in preallocated float64 arrays that `step`
+    updates with `out=` ufuncs, and readers get read-only views of them.
+
     Implementation from https://people.duke.edu/~rnau/411avg.htm
     """
 
-    def __init__(self, value_half_life, trend_half_life, mse_half_life=None):
+    def __init__(self, value_half_life, trend_half_life, mse_half_life=None, in_place=False):
         self.__a = 0.5 ** (1 / value_half_life)
         self.__b = 0.5 ** (1 / trend_half_life)
         self.__c = 0.5 ** (1 / mse_half_life) if not mse_half_life is None else None
@@ -90,24 +265,47 @@ class HoltEma:
         self.__trend = 0
         self.__mse = 0 if not mse_half_life is None else None
         self.__samples_needed = max(value_half_life, trend_half_life)
+        self.__in_place = in_place
+        self.__views = None
 
     @property
     def value(self):
-        return self.__value
+        return self.__value if self.__views is None else self.__views[0]
 
     @property
     def trend(self):
-        return self.__trend
+        return self.__trend if self.__views is None else self.__views[1]
 
     @property
     def mse(self):
-        return self.__mse
+        if self.__views is None or self.__mse is None:
+            return self.__mse
+        return self.__views[2]
 
     @property
     def stderr(self):
         return np.sqrt(self.__mse)
 
+    def __set_state(self, value, trend, mse):
+        if not self.__in_place:
+            self.__value, self.__trend, self.__mse = value, trend, mse
+            return
+        if self.__views is None:
+            self.__value = np.array(value, dtype=np.float64)
+            self.__trend = np.zeros_like(self.__value)
+            self.__mse = None if mse is None else np.zeros_like(self.__value)
+            self.__value_old = np.empty_like(self.__value)
+            self.__scratch = np.empty_like(self.__value)
+            self.__views = [_read_only(self.__value), _read_only(self.__trend)]
+            self.__views.append(None if mse is None else _read_only(self.__mse))
+        np.copyto(self.__value, value)
+        np.copyto(self.__trend, trend)
+        if not mse is None:
+            np.copyto(self.__mse, mse)
+
     def step(self, x):
+        if self.__in_place:
+            return self.__step_in_place(x)
         if self.__value is None:
             self.__value = x
         value_old = self.__value
@@ -119,15 +317,76 @@ class HoltEma:
         self.__samples_needed = max(0, self.__samples_needed - 1)
         return self.__value
 
+    def __step_in_place(self, x):
+        x = np.asarray(x)
+        if self.__views is None:
+            self.__set_state(x, self.__trend, self.__mse)
+        value, trend, scratch = self.__value, self.__trend, self.__scratch
+
+        np.copyto(self.__value_old, value)
+        value += trend
+        value *= self.__a
+        np.multiply(1 - self.__a, x, out=scratch)
+        value += scratch
+        trend *= self.__b
+        np.subtract(value, self.__value_old, out=scratch)
+        scratch *= 1 - self.__b
+        trend += scratch
+        if not self.__mse is None:
+            np.add(value, trend, out=scratch)
+            np.subtract(x, scratch, out=scratch)
+            np.square(scratch, out=scratch)
+            scratch *= 1 - self.__c
+            self.__mse += scratch
+            self.__mse *= self.__c
+        self.__samples_needed = max(0, self.__samples_needed - 1)
+        return self.__views[0]
+
+    def step_many(self, X):
+        """Steps through the rows of `X` in one vectorized pass.
+
+        Equivalent to calling `step` on every row of `X` in order.
+
+        Args:
+            X: A 2D array or DataFrame with one row per observation.
+
+        Returns:
+            The path of values, one row per observation.
+
+        """
+        xs = _as_array(X)
+        if len(xs) == 0:
+            return _like(X, xs)
+        value = xs[0] if self.__value is None else self.__value
+        values, trends = _holt_filter(self.__a, self.__b, xs, value, self.__trend)
+
+        mse = None
+        if not self.__mse is None:
+            errors = xs - (values + trends)
+            c = self.__c
+            mse = _row_like(X, _ema_filter(c, c * (1 - c), errors ** 2, self.__mse)[-1])
+        self.__set_state(_row_like(X, values[-1]), _row_like(X, trends[-1]), mse)
+        self.__samples_needed = max(0, self.__samples_needed - len(xs))
+        return _like(X, values)
+
     @property
     def ready(self):
         return self.__samples_needed == 0
 
 
 class TrendEstimator:
-    def __init__(self, estimator, init=None):
+    """Feeds first differences of its input to another estimator.
+
+    With `in_place` set, the previous input and the difference are held in preallocated float64
+    arrays, so pairing it with an in-place estimator keeps `step` allocation-free.
+    """
+
+    def __init__(self, estimator, init=None, in_place=False):
         self.estimator = estimator
-        self.__prev = init
+        self.__in_place = in_place
+        self.__prev = None
+        if not init is None:
+            self.__set_prev(init)
 
     @property
     def prev(self):
@@ -137,9 +396,614 @@ class TrendEstimator:
     def ready(self):
         return self.estimator.ready
 
+    def __set_prev(self, prev):
+        if not self.__in_place:
+            self.__prev = prev
+        elif self.__prev is None:
+            self.__prev = np.array(prev, dtype=np.float64)
+            self.__diff = np.empty_like(self.__prev)
+        else:
+            np.copyto(self.__prev, prev)
+
     def step(self, x):
+        if self.__in_place:
+            return self.__step_in_place(x)
         if self.__prev is None:
             self.__prev = x
         diff = x - self.__prev
         self.__prev = x
         return self.estimator.step(diff)
+
+    def __step_in_place(self, x):
+        if self.__prev is None:
+            self.__set_prev(x)
+        np.subtract(x, self.__prev, out=self.__diff)
+        np.copyto(self.__prev, x)
+        return self.estimator.step(self.__diff)
+
+    def step_many(self, X):
+        """Steps through the rows of `X` in one vectorized pass.
+
+        Equivalent to calling `step` on every row of `X` in order.
+
+        Args:
+            X: A 2D array or DataFrame with one row per observation.
+
+        Returns:
+            The path of the underlying estimator, one row per observation.
+
+        """
+        xs = _as_array(X)
+        if len(xs) == 0:
+            return self.estimator.step_many(X)
+        prev = xs[0] if self.__prev is None else _as_array(self.__prev)
+        diffs = np.diff(xs, axis=0, prepend=prev[np.newaxis])
+        self.__set_prev(_row_like(X, xs[-1]))
+        return self.estimator.step_many(_like(X, diffs))
+
+
+class EstimatorBank:
+    """A bank of Holt estimators over K half-life configurations and N series.
+
+    Each configuration is a `(value_half_life, trend_half_life, mse_half_life)` tuple, where a trend
+    or mse half-life of None disables that component. `(hl, None, None)` behaves like `Ema(hl)` and
+    `(hl, thl, mhl)` like `HoltEma(hl, thl, mhl)`. With `differenced` set, every configuration is
+    fed first differences of the input, like a `TrendEstimator`, starting from `init` if given.
+
+    All state lives in contiguous (K, N) float64 arrays. `step` updates them in place with
+    broadcasted ufuncs and preallocated scratch space, so a tick allocates nothing. Readers get
+    read-only views, either of the whole bank or of a single configuration through `bank[k]`.
+
+    Args:
+        half_lives (list): A list of K `(value_half_life, trend_half_life, mse_half_life)` tuples.
+        n (int): The number of series N.
+        differenced (bool): Whether to estimate on first differences of the input.
+        init: An optional (N,) or (K, N) previous input to difference the first observation against.
+
+    """
+
+    class View:
+        """Read-only access to a single configuration of an `EstimatorBank`."""
+
+        def __init__(self, bank, k):
+            self.__bank = bank
+            self.__k = k
+
+        @property
+        def value(self):
+            return self.__bank.values[self.__k]
+
+        @property
+        def trend(self):
+            return self.__bank.trends[self.__k]
+
+        @property
+        def mse(self):
+            if not self.__bank.has_mse[self.__k]:
+                return None
+            return self.__bank.mses[self.__k]
+
+        @property
+        def stderr(self):
+            return np.sqrt(self.mse)
+
+        @property
+        def ready(self):
+            return self.__bank.samples_needed[self.__k] == 0
+
+    def __init__(self, half_lives, n, differenced=False, init=None):
+        half_lives = [tuple(hls) + (None,) * (3 - len(hls)) for hls in half_lives]
+        shape = (len(half_lives), n)
+
+        def decay(half_life):
+            return 1.0 if half_life is None else 0.5 ** (1 / half_life)
+
+        def coefficient(values):
+            # Column vectors broadcast against (K, N) state.
+            return np.array(values, dtype=np.float64)[:, np.newaxis]
+
+        self.__a = coefficient([decay(v) for v, _, _ in half_lives])
+        self.__b = coefficient([decay(t) for _, t, _ in half_lives])
+        self.__c = coefficient([decay(m) for _, _, m in half_lives])
+        self.__1_a = 1 - self.__a
+        self.__1_b = 1 - self.__b
+        self.__1_c = 1 - self.__c
+        self.__has_mse = np.array([m is not None for _, _, m in half_lives])
+        self.__samples_needed = np.array(
+            [max(v, t or 0) for v, t, _ in half_lives], dtype=np.float64
+        )
+        self.__differenced = differenced
+        self.__has_prev = init is not None
+        self.__initialized = False
+
+        self.__value = np.zeros(shape)
+        self.__trend = np.zeros(shape)
+        self.__mse = np.zeros(shape)
+        self.__prev = np.zeros(shape)
+        if init is not None:
+            np.copyto(self.__prev, _as_array(init))
+        self.__input = np.zeros(shape)
+        self.__value_old = np.zeros(shape)
+        self.__scratch = np.zeros(shape)
+
+        self.__values = _read_only(self.__value)
+        self.__trends = _read_only(self.__trend)
+        self.__mses = _read_only(self.__mse)
+        self.__readable_has_mse = _read_only(self.__has_mse)
+        self.__readable_samples_needed = _read_only(self.__samples_needed)
+        self.__views = [EstimatorBank.View(self, k) for k in range(len(half_lives))]
+
+    def __getitem__(self, k):
+        return self.__views[k]
+
+    def __len__(self):
+        return len(self.__views)
+
+    @property
+    def values(self):
+        return self.__values
+
+    @property
+    def trends(self):
+        return self.__trends
+
+    @property
+    def mses(self):
+        return self.__mses
+
+    @property
+    def has_mse(self):
+        return self.__readable_has_mse
+
+    @property
+    def samples_needed(self):
+        return self.__readable_samples_needed
+
+    @property
+    def ready(self):
+        return not self.__samples_needed.any()
+
+    def __load_input(self, x):
+        # Broadcasts an (N,) or (K, N) input into the input buffer, differencing if necessary.
+        if not self.__differenced:
+            np.copyto(self.__input, x)
+        elif not self.__has_prev:
+            np.copyto(self.__prev, x)
+            self.__input.fill(0)
+            self.__has_prev = True
+        else:
+            np.subtract(x, self.__prev, out=self.__input)
+            np.copyto(self.__prev, x)
+        if not self.__initialized:
+            np.copyto(self.__value, self.__input)
+            self.__initialized = True
+
+    def step(self, x):
+        """Updates every estimator in the bank with one observation per series.
+
+        Args:
+            x: An (N,) array fed to every configuration, or a (K, N) array with one row per
+                configuration.
+
+        Returns:
+            ndarray: A read-only (K, N) view of the new values.
+
+        """
+        self.__load_input(x)
+        x = self.__input
+        value, trend, mse, scratch = self.__value, self.__trend, self.__mse, self.__scratch
+
+        np.copyto(self.__value_old, value)
+        # value = a * (value + trend) + (1 - a) * x
+        value += trend
+        value *= self.__a
+        np.multiply(self.__1_a, x, out=scratch)
+        value += scratch
+        # trend = b * trend + (1 - b) * (value - value_old)
+        trend *= self.__b
+        np.subtract(value, self.__value_old, out=scratch)
+        scratch *= self.__1_b
+        trend += scratch
+        # mse = c * (mse + (1 - c) * (x - (value + trend)) ** 2)
+        np.add(value, trend, out=scratch)
+        np.subtract(x, scratch, out=scratch)
+        np.square(scratch, out=scratch)
+        scratch *= self.__1_c
+        mse += scratch
+        mse *= self.__c
+
+        self.__samples_needed -= 1
+        np.maximum(self.__samples_needed, 0, out=self.__samples_needed)
+        return self.__values
+
+    def step_many(self, X):
+        """Steps through the rows of `X` in one vectorized pass.
+
+        Equivalent to calling `step` on every row of `X` in order.
+
+        Args:
+            X: A (T, N) array fed to every configuration, or a (T, K, N) array.
+
+        Returns:
+            ndarray: The (T, K, N) path of values.
+
+        """
+        xs = _as_array(X)
+        if xs.ndim == 2:
+            xs = xs[:, np.newaxis, :]
+        xs = np.broadcast_to(xs, (len(xs),) + self.__value.shape)
+        if len(xs) == 0:
+            return np.array(xs)
+        if self.__differenced:
+            prev = self.__prev if self.__has_prev else xs[0]
+            diffs = np.diff(xs, axis=0, prepend=prev[np.newaxis])
+            np.copyto(self.__prev, xs[-1])
+            self.__has_prev = True
+            xs = diffs
+        if not self.__initialized:
+            np.copyto(self.__value, xs[0])
+            self.__initialized = True
+
+        paths = np.empty(xs.shape)
+        for k in range(len(self)):
+            a, b, c = self.__a[k, 0], self.__b[k, 0], self.__c[k, 0]
+            values, trends = _holt_filter(a, b, xs[:, k], self.__value[k], self.__trend[k])
+            if self.__has_mse[k]:
+                errors = xs[:, k] - (values + trends)
+                self.__mse[k] = _ema_filter(c, c * (1 - c), errors ** 2, self.__mse[k])[-1]
+            self.__value[k] = values[-1]
+            self.__trend[k] = trends[-1]
+            paths[:, k] = values
+
+        self.__samples_needed -= len(xs)
+        np.maximum(self.__samples_needed, 0, out=self.__samples_needed)
+        return paths
+
+
+class _KahanSum:
+    """A compensated running sum of equally shaped arrays, updated in place."""
+
+    def __init__(self, shape):
+        self.__total = np.zeros(shape)
+        self.__compensation = np.zeros(shape)
+        self.__y = np.zeros(shape)
+        self.__t = np.zeros(shape)
+
+    @property
+    def total(self):
+        return self.__total
+
+    def __accumulate(self):
+        # Kahan step for an addend already stored in `__y` (minus the compensation).
+        np.add(self.__total, self.__y, out=self.__t)
+        np.subtract(self.__t, self.__total, out=self.__compensation)
+        self.__compensation -= self.__y
+        np.copyto(self.__total, self.__t)
+
+    def add(self, x):
+        np.subtract(x, self.__compensation, out=self.__y)
+        self.__accumulate()
+
+    def subtract(self, x):
+        np.add(x, self.__compensation, out=self.__y)
+        np.negative(self.__y, out=self.__y)
+        self.__accumulate()
+
+    def reset(self, total):
+        np.copyto(self.__total, total)
+        self.__compensation.fill(0)
+
+
+class RollingMoments:
+    """Exact mean and covariance of the last `window_size` observations of a d-dimensional series.
+
+    Keeps compensated sums of the observations and of their outer products, both shifted by an
+    anchor near the mean, and updates them as observations enter and leave the window. A `step`
+    therefore costs O(d^2) regardless of the window size. Every `reanchor_period` steps the anchor
+    moves to the current mean and the sums are rebuilt from the window, which bounds floating point
+    drift at an amortized O(d^2) per step.
+
+    Statistics use one degree of freedom for the mean, like Pandas' `var` and `cov`, and are NaN
+    until there are enough observations (one for the mean, two for the rest).
+
+    Args:
+        window_size (int): Number of observations in the window.
+        dim (int): Dimension d of each observation.
+        reanchor_period (int): Steps between rebuilds of the sums. Defaults to `window_size`.
+
+    """
+
+    def __init__(self, window_size, dim=1, reanchor_period=None):
+        self.__window = RingBuffer(window_size, dtype=(np.float64, dim))
+        self.__reanchor_period = reanchor_period or window_size
+        self.__steps_since_anchor = 0
+        self.__anchor = None
+        self.__sum = _KahanSum((dim,))
+        self.__sum_squares = _KahanSum((dim, dim))
+        self.__deviation = np.zeros(dim)
+        self.__outer = np.zeros((dim, dim))
+
+    @property
+    def window(self):
+        return self.__window
+
+    @property
+    def count(self):
+        return len(self.__window)
+
+    @property
+    def ready(self):
+        return self.__window.is_full
+
+    @property
+    def mean(self):
+        if self.count < 1:
+            return np.full(self.__sum.total.shape, np.nan)
+        return self.__anchor + self.__sum.total / self.count
+
+    @property
+    def covariance(self):
+        n = self.count
+        sums = self.__sum.total
+        if n < 2:
+            return np.full(self.__sum_squares.total.shape, np.nan)
+        return (self.__sum_squares.total - np.outer(sums, sums) / n) / (n - 1)
+
+    @property
+    def variance(self):
+        return np.diag(self.covariance).copy()
+
+    @property
+    def stddev(self):
+        return np.sqrt(self.variance)
+
+    @property
+    def correlation(self):
+        covariance = self.covariance
+        stddev = np.sqrt(np.diag(covariance))
+        return covariance / np.outer(stddev, stddev)
+
+    def __remove(self, x):
+        np.subtract(x, self.__anchor, out=self.__deviation)
+        np.outer(self.__deviation, self.__deviation, out=self.__outer)
+        self.__sum.subtract(self.__deviation)
+        self.__sum_squares.subtract(self.__outer)
+
+    def __add(self, x):
+        np.subtract(x, self.__anchor, out=self.__deviation)
+        np.outer(self.__deviation, self.__deviation, out=self.__outer)
+        self.__sum.add(self.__deviation)
+        self.__sum_squares.add(self.__outer)
+
+    def step(self, x):
+        """Adds an observation to the window, evicting the oldest one if the window is full.
+
+        Args:
+            x: An observation of dimension d.
+
+        """
+        if self.__anchor is None:
+            self.__anchor = np.array(x, dtype=np.float64).reshape(-1)
+        if self.__window.is_full:
+            self.__remove(self.__window[0])
+        self.__window.append(x)
+        self.__add(x)
+        self.__steps_since_anchor += 1
+        if self.__steps_since_anchor >= self.__reanchor_period:
+            self.reanchor()
+
+    def extend(self, X):
+        """Adds many observations to the window at once and rebuilds the sums.
+
+        Args:
+            X: A 2D array or DataFrame with one row per observation.
+
+        """
+        self.__window.extend(_as_array(X).reshape(len(X), -1))
+        self.reanchor()
+
+    def reanchor(self):
+        """Moves the anchor to the current mean and recomputes the sums exactly from the window."""
+        self.__steps_since_anchor = 0
+        if self.count == 0:
+            return
+        observations = np.asarray(self.__window)
+        self.__anchor = observations.mean(axis=0)
+        deviations = observations - self.__anchor
+        self.__sum.reset(deviations.sum(axis=0))
+        self.__sum_squares.reset(deviations.T @ deviations)
+
+
+class RollingOls:
+    """Exact OLS regression with intercept over the last `window_size` observations.
+
+    Built on the `RollingMoments` of the stacked regressors and target, so a `step` costs O(d^2)
+    and reading the coefficients costs one d-dimensional solve.
+
+    Args:
+        window_size (int): Number of observations in the window.
+        n_regressors (int): Number of regressors d.
+        reanchor_period (int): Steps between rebuilds of the sums. Defaults to `window_size`.
+
+    """
+
+    def __init__(self, window_size, n_regressors=1, reanchor_period=None):
+        self.__p = n_regressors
+        self.__moments = RollingMoments(window_size, n_regressors + 1, reanchor_period)
+        self.__observation = np.zeros(n_regressors + 1)
+
+    @property
+    def moments(self):
+        return self.__moments
+
+    @property
+    def count(self):
+        return self.__moments.count
+
+    @property
+    def ready(self):
+        return self.__moments.ready
+
+    @property
+    def beta(self):
+        covariance = self.__moments.covariance
+        p = self.__p
+        return np.linalg.solve(covariance[:p, :p], covariance[:p, p])
+
+    @property
+    def intercept(self):
+        mean = self.__moments.mean
+        return mean[self.__p] - mean[: self.__p] @ self.beta
+
+    @property
+    def residual_variance(self):
+        """Unbiased variance of the residuals, with one degree of freedom per coefficient."""
+        covariance = self.__moments.covariance
+        p = self.__p
+        explained = covariance[p, :p] @ self.beta
+        return (self.count - 1) * (covariance[p, p] - explained) / (self.count - p - 1)
+
+    def step(self, x, y):
+        """Adds an observation of regressors `x` and target `y` to the window."""
+        self.__observation[: self.__p] = x
+        self.__observation[self.__p] = y
+        self.__moments.step(self.__observation)
+
+    def extend(self, X, Y):
+        """Adds many observations at once.
+
+        Args:
+            X: A 2D array or DataFrame of regressors with one row per observation.
+            Y: A 1D array or Series of targets.
+
+        """
+        self.__moments.extend(
+            np.hstack([_as_array(X).reshape(len(Y), -1), _as_array(Y).reshape(-1, 1)])
+        )
+
+
+def test_step_many():
+    """Tests that `step_many` matches repeated calls to `step`, including the final state."""
+    rng = np.random.RandomState(0)
+    X = pd.DataFrame(100 + rng.randn(200, 3).cumsum(axis=0), columns=["a", "b", "c"])
+
+    def pairs():
+        yield Ema(10), Ema(10)
+        yield Ema(10, X.iloc[0] * 0.9), Ema(10, X.iloc[0] * 0.9)
+        yield Emse(10), Emse(10)
+        yield HoltEma(5, 20), HoltEma(5, 20)
+        yield HoltEma(5, 20, 30), HoltEma(5, 20, 30)
+        yield TrendEstimator(HoltEma(3, 9)), TrendEstimator(HoltEma(3, 9))
+        yield TrendEstimator(HoltEma(3, 9), X.iloc[-1]), TrendEstimator(HoltEma(3, 9), X.iloc[-1])
+
+    for looped, bulk in pairs():
+        # Split the warmup to check that state carries over between calls.
+        expected = pd.DataFrame([looped.step(row) for _, row in X.iterrows()])
+        path = pd.concat([bulk.step_many(X.iloc[:50]), bulk.step_many(X.iloc[50:])])
+        np.testing.assert_allclose(path.values, expected.values, rtol=1e-9)
+        assert bulk.ready == looped.ready
+        assert np.allclose(looped.step(X.iloc[0]), bulk.step(X.iloc[0]), rtol=1e-9)
+
+    holt_looped, holt_bulk = HoltEma(4, 8, 8), HoltEma(4, 8, 8)
+    for x in X.values[:, 0]:
+        holt_looped.step(x)
+    holt_bulk.step_many(X.values[:, 0])
+    assert np.isclose(holt_looped.trend, holt_bulk.trend, rtol=1e-9)
+    assert np.isclose(holt_looped.mse, holt_bulk.mse, rtol=1e-9)
+
+
+def test_in_place():
+    """Tests that in-place estimators match the default path and reuse their buffers."""
+    rng = np.random.RandomState(3)
+    X = pd.DataFrame(100 + rng.randn(100, 1000).cumsum(axis=0))
+
+    def pairs(in_place):
+        yield Ema(10, in_place=in_place)
+        yield Emse(10, in_place=in_place)
+        yield HoltEma(5, 20, 30, in_place=in_place)
+        yield TrendEstimator(HoltEma(3, 9, in_place=in_place), in_place=in_place)
+
+    for default, in_place in zip(pairs(False), pairs(True)):
+        in_place.step_many(X.iloc[:50])
+        for _, x in X.iloc[:50].iterrows():
+            default.step(x)
+        for _, x in X.iloc[50:90].iterrows():
+            np.testing.assert_allclose(in_place.step(x), default.step(x), rtol=1e-9)
+        assert not in_place.step(X.iloc[90]).flags.writeable
+
+        # Steady-state ticks write into the same buffer.
+        address = in_place.step(X.values[91]).__array_interface__["data"][0]
+        for x in X.values[92:]:
+            assert in_place.step(x).__array_interface__["data"][0] == address
+
+
+def test_estimator_bank():
+    """Tests that an `EstimatorBank` tracks the equivalent standalone estimators."""
+    rng = np.random.RandomState(1)
+    X = 100 + rng.randn(120, 4).cumsum(axis=0)
+    half_lives = [(10, None, None), (5, 20, 30), (3, 9)]
+
+    for differenced in [False, True]:
+        estimators = [Ema(10), HoltEma(5, 20, 30), HoltEma(3, 9)]
+        if differenced:
+            estimators = [TrendEstimator(e) for e in estimators]
+        looped = EstimatorBank(half_lives, 4, differenced=differenced)
+        bulk = EstimatorBank(half_lives, 4, differenced=differenced)
+
+        for x in X:
+            expected = [e.step(x) for e in estimators]
+            np.testing.assert_allclose(looped.step(x), expected, rtol=1e-9)
+        bulk.step_many(X[:70])
+        path = bulk.step_many(X[70:])
+        np.testing.assert_allclose(path[-1], looped.values, rtol=1e-9)
+
+        for bank in [looped, bulk]:
+            holt = estimators[1].estimator if differenced else estimators[1]
+            np.testing.assert_allclose(bank[1].trend, holt.trend, rtol=1e-9, atol=1e-12)
+            np.testing.assert_allclose(bank[1].mse, holt.mse, rtol=1e-9)
+            assert bank[0].mse is None
+            assert bank.ready
+            assert not bank.values.flags.writeable
+
+
+def test_rolling_moments():
+    """Tests rolling moments and OLS against full recomputation over the window."""
+    rng = np.random.RandomState(2)
+    window_size = 50
+    X = 1e4 + rng.randn(1000, 3).cumsum(axis=0)
+    Y = X @ [0.5, -2.0, 1.0] + 3 + rng.randn(1000)
+
+    moments = RollingMoments(window_size, 3)
+    ols = RollingOls(window_size, 3, reanchor_period=10 ** 9)
+    ols.extend(X[:30], Y[:30])
+    for t in range(1000):
+        moments.step(X[t])
+        if t >= 30:
+            ols.step(X[t], Y[t])
+
+    window = X[-window_size:]
+    np.testing.assert_allclose(moments.mean, window.mean(axis=0), rtol=1e-12)
+    np.testing.assert_allclose(moments.covariance, np.cov(window.T), rtol=1e-8)
+    np.testing.assert_allclose(moments.variance, window.var(axis=0, ddof=1), rtol=1e-8)
+    np.testing.assert_allclose(moments.correlation, np.corrcoef(window.T), rtol=1e-8)
+
+    A = np.hstack([window, np.ones((window_size, 1))])
+    coefficients, residuals = np.linalg.lstsq(A, Y[-window_size:], rcond=None)[:2]
+    np.testing.assert_allclose(ols.beta, coefficients[:3], rtol=1e-6)
+    np.testing.assert_allclose(ols.intercept, coefficients[3], rtol=1e-4)
+    np.testing.assert_allclose(ols.residual_variance, residuals[0] / (window_size - 4), rtol=1e-5)
+    assert ols.ready and moments.ready
+
+
+def test_rolling_moments_few_samples():
+    """Tests that rolling moments are NaN until there are enough observations."""
+    moments = RollingMoments(10, 2)
+    assert moments.mean.shape == (2,) and np.isnan(moments.mean).all()
+    assert moments.covariance.shape == (2, 2) and np.isnan(moments.covariance).all()
+
+    moments.step([1.0, 2.0])
+    np.testing.assert_allclose(moments.mean, [1.0, 2.0])
+    assert np.isnan(moments.covariance).all() and np.isnan(moments.stddev).all()
+
+    moments.step([3.0, 2.0])
+    np.testing.assert_allclose(moments.variance, [2.0, 0.0])
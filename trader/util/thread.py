@@ -4,65 +4,171 @@ Primitives and infrastructure for multithreading.
 
 """
 
-import datetime
+import math
 import sys
 import time
 import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 from queue import Queue
-from threading import Condition, Lock, Thread
+from threading import Condition, Lock, Thread, current_thread
 
 from trader.util.log import Log
+from trader.util.trace import LatencyHistogram
 
 
-class Beat:
-    """A helper utility for running timed loops.
+class _Timer:
+    """The state of a timer in a `Scheduler`."""
 
-    Use this to schedule a function that runs once a minute, regardless of how long it takes to
-    actually run the function.
+    def __init__(self, name, fn, interval, phase, overrun, deadline):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.phase = phase
+        self.overrun = overrun
+        self.deadline = deadline
+        self.fired = 0
+        self.skipped = 0
+        self.jitter = LatencyHistogram()
 
-    Args:
-        interval (int): Milliseconds between beats.
+
+class Scheduler:
+    """Runs named timers on one thread, at absolute deadlines on the monotonic clock.
+
+    A timer fires every `interval` milliseconds at deadlines aligned to multiples of its interval in
+    wall-clock time, e.g. at the top of every minute for an interval of 60000, in line with candle
+    closes. The offset between the wall clock and `time.monotonic_ns` is measured once, after which
+    deadlines advance on the monotonic clock. They neither drift with the time the timers take nor
+    jump when the wall clock is adjusted.
+
+    A timer whose function runs past its next deadlines handles them by its `Scheduler.Overrun`
+    policy. The lateness of every firing is recorded as jitter.
 
     """
 
-    def __init__(self, interval):
-        self.__interval = interval
-        self.__last_beat = None
-
-    def loop(self):
-        """Runs the timed loop and sleeps as necessary."""
-        # Run sleep if a last beat time exists.
-        if self.__last_beat is not None:
-            delta = datetime.datetime.now() - self.__last_beat
-            duration_to_sleep = (self.__interval / 1000.0) - delta.total_seconds()
-            if duration_to_sleep < 0:
-                Log.warn("loop body too slow for beat interval")
-            else:
-                time.sleep(duration_to_sleep)
-            self.__last_beat = None
+    class Overrun(Enum):
+        # Fire once, late, for the latest missed deadline and skip the others.
+        SKIP = 1
+        # Fire once for every missed deadline, back to back.
+        CATCH_UP = 2
+
+    def __init__(self):
+        self.__condition = Condition()
+        self.__timers = OrderedDict()
+        self.__stopped = False
+        self.__wall_offset = time.time_ns() - time.monotonic_ns()
+
+    def __next_deadline(self, now, interval, phase):
+        # The first monotonic time after `now` that is `phase` past a wall-clock multiple of
+        # `interval`.
+        return now + interval - (now + self.__wall_offset - phase) % interval
 
-        # Set a new last beat time for the next iteration.
-        self.__last_beat = datetime.datetime.now()
-        return True
+    def add(self, name, fn, interval, phase=0, overrun=Overrun.SKIP):
+        """Adds a timer, or replaces the timer of the same name.
 
-    def clear(self):
-        """Clears the last beat time for this loop."""
-        self.__last_beat = None
+        Args:
+            name (str): A name to identify the timer.
+            fn (Function): A function to run when the timer fires.
+            interval (int): Milliseconds between firings.
+            phase (int): Milliseconds past each wall-clock multiple of `interval` to fire at.
+            overrun (Scheduler.Overrun): How to handle missed deadlines.
+
+        """
+        interval_ns = int(interval * 1_000_000)
+        phase_ns = int(phase * 1_000_000)
+        deadline = self.__next_deadline(time.monotonic_ns(), interval_ns, phase_ns)
+        with self.__condition:
+            self.__timers[name] = _Timer(name, fn, interval_ns, phase_ns, overrun, deadline)
+            self.__condition.notify_all()
+
+    def remove(self, name):
+        with self.__condition:
+            self.__timers.pop(name, None)
+            self.__condition.notify_all()
+
+    def stop(self):
+        """Makes `run` return once the timer that is currently firing, if any, is done."""
+        with self.__condition:
+            self.__stopped = True
+            self.__condition.notify_all()
+
+    def __next_timer(self):
+        # Waits for the next deadline and returns the timer to fire, or None once stopped.
+        with self.__condition:
+            while not self.__stopped:
+                now = time.monotonic_ns()
+                timer = min(self.__timers.values(), key=lambda t: t.deadline, default=None)
+                if timer is None:
+                    self.__condition.wait()
+                elif timer.deadline > now:
+                    self.__condition.wait((timer.deadline - now) / 1e9)
+                else:
+                    if timer.overrun == Scheduler.Overrun.SKIP:
+                        missed = (now - timer.deadline) // timer.interval
+                        timer.skipped += missed
+                        timer.deadline += missed * timer.interval
+                    timer.jitter.record((now - timer.deadline) / 1e9)
+                    timer.fired += 1
+                    timer.deadline += timer.interval
+                    return timer
+            return None
+
+    def run(self):
+        """Fires timers as they come due until `stop` is called. Cannibalizes the current thread."""
+        while True:
+            timer = self.__next_timer()
+            if timer is None:
+                return
+            timer.fn()
+
+    def stats(self):
+        """The number of firings, skipped deadlines and jitter summary of every timer, by name."""
+        with self.__condition:
+            return OrderedDict(
+                (
+                    name,
+                    {
+                        "fired": timer.fired,
+                        "skipped": timer.skipped,
+                        "jitter": timer.jitter.summary(),
+                    },
+                )
+                for name, timer in self.__timers.items()
+            )
+
+    def dump(self):
+        Log.info("scheduler", dict(self.stats()))
 
 
 class MVar:
     """A partial implementation of a Haskell MVar.
 
-    Many of the usual functions (e.g. `put` or `take`) are missing, but the general concept (of a
-    shared memory location for threads) is the same.
+    Many of the usual functions (e.g. `put`) are missing, but the general concept (of a shared
+    memory location for threads) is the same.
+
+    Every value put in the `MVar` gets the next version, starting from 1, so that readers can wait
+    for a newer value than the last one they saw with `read_newer`. Hot readers that cannot afford
+    the lock can use `try_read` instead.
 
     """
 
     def __init__(self):
         self.__lock = Lock()
         self.__condition = Condition(lock=self.__lock)
-        self.__value = None
+        # The version and value are replaced together, so lock-free readers never see a value with
+        # another value's version.
+        self.__state = (0, None)
+
+    def __put(self, new_value):
+        # Assumes the lock is held.
+        self.__state = (self.__state[0] + 1, new_value)
+        self.__condition.notify_all()
+
+    @property
+    def version(self):
+        """The version of the latest value put in the `MVar`, or 0 if there has been none."""
+        return self.__state[0]
 
     def swap(self, new_value):
         """Puts a new value in the `MVar` and returns the old value, if any.
@@ -74,26 +180,81 @@ class MVar:
             The old value.
 
         """
-        self.__lock.acquire()
-        old_value = self.__value
-        self.__value = new_value
-        self.__condition.notify_all()
-        self.__lock.release()
-        return old_value
+        with self.__lock:
+            old_value = self.__state[1]
+            self.__put(new_value)
+            return old_value
 
-    def read(self):
+    def read(self, timeout=None):
         """Reads the current value of the `MVar`. Blocks until a value is ready.
 
+        Args:
+            timeout (float): The maximum number of seconds to wait, if any.
+
+        Returns:
+            The current value, or None if the timeout expired first.
+
+        """
+        with self.__lock:
+            self.__condition.wait_for(lambda: self.__state[1] is not None, timeout)
+            return self.__state[1]
+
+    def read_newer(self, version, timeout=None):
+        """Reads the current value of the `MVar` once it is newer than `version`. Blocks until then.
+
+        Args:
+            version (int): The version of the last value seen, or 0 to wait for any value.
+            timeout (float): The maximum number of seconds to wait, if any.
+
+        Returns:
+            (value, int): The current value and its version. If the timeout expired first, the
+                version is not newer than `version`.
+
+        """
+        with self.__lock:
+            self.__condition.wait_for(lambda: self.__state[0] > version, timeout)
+            version, value = self.__state
+            return value, version
+
+    def try_read(self):
+        """Reads the current value of the `MVar` without blocking or taking the lock.
+
+        Returns:
+            (value, int): The current value, or None if empty, and its version.
+
+        """
+        version, value = self.__state
+        return value, version
+
+    def try_put(self, new_value):
+        """Puts a new value in the `MVar` only if it is empty.
+
+        Args:
+            new_value: The new value.
+
+        Returns:
+            bool: Whether the value was put.
+
+        """
+        with self.__lock:
+            if self.__state[1] is not None:
+                return False
+            self.__put(new_value)
+            return True
+
+    def take(self):
+        """Takes the current value out of the `MVar`, leaving it empty. Blocks until a value is
+        ready.
+
         Returns:
-            The current value.
+            The taken value.
 
         """
-        self.__lock.acquire()
-        if self.__value is None:
-            self.__condition.wait()
-        read_value = self.__value
-        self.__lock.release()
-        return read_value
+        with self.__lock:
+            self.__condition.wait_for(lambda: self.__state[1] is not None)
+            version, taken_value = self.__state
+            self.__state = (version, None)
+            return taken_value
 
 
 def test_mvar_simple():
@@ -116,10 +277,121 @@ def test_mvar_simple():
     assert result == 1
 
 
+def test_mvar_take():
+    """Tests that `take` empties the `MVar` and only sees the latest swapped value."""
+    var = MVar()
+    assert var.swap(1) is None
+    assert var.swap(2) == 1
+    assert var.take() == 2
+    assert var.swap(3) is None
+    assert var.read() == 3
+    assert not var.try_put(4)
+    assert var.take() == 3
+    assert var.try_put(5)
+    assert var.take() == 5
+
+
+def test_mvar_versions():
+    """Tests waiting for newer values of an `MVar`, with and without timeouts."""
+    var = MVar()
+    assert var.try_read() == (None, 0)
+    assert var.read(timeout=0.01) is None
+    assert var.read_newer(0, timeout=0.01) == (None, 0)
+
+    def writer():
+        for i in range(1, 101):
+            var.swap(i)
+
+    thread = Thread(target=writer)
+    thread.start()
+    seen = []
+    value, version = var.read_newer(0)
+    while value < 100:
+        seen.append(value)
+        value, newer_version = var.read_newer(version)
+        assert newer_version > version and value == newer_version
+        version = newer_version
+    thread.join()
+    assert seen == sorted(set(seen))
+
+    assert var.try_read() == (100, 100)
+    assert var.take() == 100 and var.version == 100
+    assert var.read_newer(100, timeout=0.01) == (None, 100)
+
+
+def test_scheduler():
+    """Tests that timers fire on aligned deadlines, and both ways of handling overruns."""
+    scheduler = Scheduler()
+    wall_offset = time.time_ns() - time.monotonic_ns()
+    phases = []
+
+    def aligned():
+        phases.append((time.monotonic_ns() + wall_offset) % 100_000_000)
+        if len(phases) == 5:
+            scheduler.stop()
+
+    scheduler.add("aligned", aligned, 100, phase=5)
+    scheduler.add("idle", lambda: None, 7)
+    scheduler.run()
+    stats = scheduler.stats()
+    assert stats["aligned"]["fired"] == 5 and stats["idle"]["fired"] > 20
+    # Unaligned firings would be late by 50ms on average; allow for a busy machine.
+    assert 5_000_000 <= sorted(phases)[2] < 25_000_000
+    assert stats["aligned"]["jitter"]["p50"] < 0.02
+
+    for overrun in Scheduler.Overrun:
+        scheduler = Scheduler()
+        firings = 0
+
+        def slow_once():
+            nonlocal firings
+            firings += 1
+            if firings == 1:
+                time.sleep(0.18)
+            elif firings == 6:
+                scheduler.stop()
+
+        scheduler.add("slow", slow_once, 50, overrun=overrun)
+        scheduler.run()
+        stats = scheduler.stats()["slow"]
+        if overrun == Scheduler.Overrun.SKIP:
+            # The first firing runs past two deadlines, and the third fires late.
+            assert stats["skipped"] >= 2 and stats["jitter"]["max"] < 0.05
+        else:
+            assert stats["skipped"] == 0 and stats["jitter"]["max"] >= 0.1
+
+
+def _thread_cpu_time(thread):
+    # CPU seconds used by a running thread, where the platform supports per-thread clocks.
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(thread.ident))
+    except (AttributeError, OSError):
+        return math.nan
+
+
+class _Supervised:
+    """The bookkeeping of a thread run by a `ThreadManager`."""
+
+    def __init__(self, name):
+        self.name = name
+        self.thread = None
+        self.alive = False
+        self.restarts = 0
+        self.cpu_time = math.nan
+
+
 class ThreadManager:
-    """A centralized runner for our Python threads.
+    """A centralized runner and supervisor for our Python threads.
+
+    Prints useful debug info on failures. A thread attached with a `ThreadManager.RestartPolicy`
+    is restarted in place when it fails (or returns, if it should run forever) until its policy
+    gives up, and only then stops the manager. Supervision is per thread: Python threads cannot be
+    stopped from outside, so there are no groups of threads that are restarted together. Short-lived
+    tasks, such as the executor's order sends, should be submitted to the manager's bounded worker
+    pool rather than attached as threads of their own.
 
-    Prints useful debug info on failures.
+    Args:
+        max_pool_threads (int): The maximum number of worker threads for `submit`.
 
     """
 
@@ -131,41 +403,94 @@ class ThreadManager:
         RUNNING = 2
         FINISHED = 3
 
-    def __init__(self):
+    class RestartPolicy:
+        """How to restart a thread that fails.
+
+        Args:
+            max_restarts (int): The number of consecutive restarts before giving up, or None to
+                restart forever.
+            backoff (float): Seconds to wait before the first restart. The wait doubles with every
+                consecutive restart.
+            max_backoff (float): The longest wait before a restart.
+            reset_after (float): A run that lasts at least this many seconds resets the backoff and
+                the count of consecutive restarts.
+
+        """
+
+        def __init__(self, max_restarts=None, backoff=1.0, max_backoff=60.0, reset_after=60.0):
+            self.max_restarts = max_restarts
+            self.backoff = backoff
+            self.max_backoff = max_backoff
+            self.reset_after = reset_after
+
+        def delay(self, restarts):
+            """Seconds to wait before restarting after `restarts` consecutive restarts."""
+            return min(self.backoff * 2 ** restarts, self.max_backoff)
+
+    def __init__(self, max_pool_threads=8):
         self.__termination_queue = Queue()
         self.__finite_thread_count = 0
         self.__completed_threads = 0
         self.__thread_runners = []
         self.__state = ThreadManager.State.INITIALIZED
+        self.__lock = Lock()
+        self.__threads = OrderedDict()
+        self.__max_pool_threads = max_pool_threads
+        self.__pool = None
 
     @property
     def num_completed_threads(self):
         return self.__completed_threads
 
-    def __propagate_error(self, name, fn, should_terminate):
-        # Used to propagate unhandled errors to the main thread.
-        try:
-            fn()
-            if should_terminate:
-                reason = None
-            else:
-                reason = "Expected thread to run forever.\n"
-            self.__termination_queue.put((name, reason))
-        except Exception:
-            self.__termination_queue.put((name, traceback.format_exc()))
-
-    def __run_daemon(self, fn):
+    def __propagate_error(self, supervised, fn, should_terminate, restart):
+        # Used to restart failed threads, and to propagate unhandled errors to the main thread.
+        with self.__lock:
+            supervised.thread = current_thread()
+            supervised.alive = True
+        restarts = 0
+        while True:
+            started_at = time.monotonic()
+            try:
+                fn()
+                if should_terminate:
+                    reason = None
+                else:
+                    reason = "Expected thread to run forever.\n"
+            except Exception:
+                reason = traceback.format_exc()
+            if reason is None or restart is None:
+                break
+            if time.monotonic() - started_at >= restart.reset_after:
+                restarts = 0
+            if restart.max_restarts is not None and restarts >= restart.max_restarts:
+                break
+            delay = restart.delay(restarts)
+            Log.warn(
+                f"restarting thread <{supervised.name}> in {delay}s",
+                reason.strip().splitlines()[-1],
+            )
+            restarts += 1
+            supervised.restarts += 1
+            time.sleep(delay)
+        with self.__lock:
+            supervised.alive = False
+            supervised.cpu_time = time.thread_time()
+        self.__termination_queue.put((supervised.name, reason))
+
+    def __run_daemon(self, name, fn):
         # Make daemon to force-kill on KeyboardInterrupts.
-        thread = Thread(target=fn, daemon=True)
+        thread = Thread(target=fn, name=name, daemon=True)
         thread.start()
 
-    def attach(self, name, fn, should_terminate=False):
+    def attach(self, name, fn, should_terminate=False, restart=None):
         """Attaches a function to this thread manager as a new thread to be created.
 
         Args:
             name (str): A name to identify the new thread.
             fn (Function): A function to run on the new thread.
             should_terminate (bool): Whether we expect this function to terminate (or run forever).
+            restart (ThreadManager.RestartPolicy): How to restart the function if it fails. By
+                default, a failure stops the thread manager.
 
         """
         if self.__state == ThreadManager.State.FINISHED:
@@ -174,13 +499,74 @@ class ThreadManager:
         if should_terminate:
             self.__finite_thread_count += 1
 
+        supervised = _Supervised(name)
+        with self.__lock:
+            self.__threads[name] = supervised
+
         def runner():
-            self.__propagate_error(name, fn, should_terminate)
+            self.__propagate_error(supervised, fn, should_terminate, restart)
 
         if self.__state == ThreadManager.State.INITIALIZED:
-            self.__thread_runners.append(runner)
+            self.__thread_runners.append((name, runner))
         else:
-            self.__run_daemon(runner)
+            self.__run_daemon(name, runner)
+
+    def submit(self, fn, *args, **kwargs):
+        """Runs a short-lived task on the bounded worker pool. Failures are logged, not raised.
+
+        Returns:
+            Future: The future of the task's result.
+
+        """
+        with self.__lock:
+            if self.__pool is None:
+                self.__pool = ThreadPoolExecutor(
+                    max_workers=self.__max_pool_threads, thread_name_prefix="pool"
+                )
+        future = self.__pool.submit(fn, *args, **kwargs)
+        future.add_done_callback(ThreadManager.__log_task_failure)
+        return future
+
+    @staticmethod
+    def __log_task_failure(future):
+        if not future.cancelled() and future.exception() is not None:
+            exc = future.exception()
+            trace = traceback.format_exception(type(exc), exc, exc.__traceback__)
+            Log.warn("pool task failed", "".join(trace))
+
+    def is_alive(self, name):
+        """Whether the thread attached as `name` is running (or waiting to be restarted)."""
+        with self.__lock:
+            supervised = self.__threads.get(name)
+            return supervised is not None and supervised.alive
+
+    def cpu_time(self, name):
+        """CPU seconds used by the thread attached as `name`, over all of its restarts. NaN where
+        the platform has no per-thread clocks, or if the thread has not started."""
+        with self.__lock:
+            supervised = self.__threads.get(name)
+            if supervised is None:
+                raise ThreadManager.Error(f"no thread named <{name}>")
+            # A live thread cannot finish while the lock is held, so its clock is still valid.
+            if supervised.alive:
+                return _thread_cpu_time(supervised.thread)
+            return supervised.cpu_time
+
+    def status(self):
+        """The liveness, restart count and CPU time of every attached thread, by name."""
+        with self.__lock:
+            names = list(self.__threads)
+        return OrderedDict(
+            (
+                name,
+                {
+                    "alive": self.is_alive(name),
+                    "restarts": self.__threads[name].restarts,
+                    "cpu_time": self.cpu_time(name),
+                },
+            )
+            for name in names
+        )
 
     def run(self):
         """Cannibalizes the current thread and runs any attached functions as children threads."""
@@ -189,8 +575,8 @@ class ThreadManager:
                 raise ThreadManager.Error("ThreadManager is currently running")
             raise ThreadManager.Error("ThreadManager has finished")
         self.__state = ThreadManager.State.RUNNING
-        for runner in self.__thread_runners:
-            self.__run_daemon(runner)
+        for name, runner in self.__thread_runners:
+            self.__run_daemon(name, runner)
         while True:
             (name, exc) = self.__termination_queue.get()
             self.__completed_threads += 1
@@ -204,3 +590,56 @@ class ThreadManager:
                 if exc is not None:
                     print(exc[:-1], file=sys.stderr)
                 raise ThreadManager.Error("see stderr for details")
+
+
+def test_thread_manager_restarts():
+    """Tests restarting failed threads, giving up after too many restarts, and the worker pool."""
+    attempts = []
+
+    def flaky():
+        attempts.append(time.monotonic())
+        if len(attempts) < 3:
+            raise ValueError("flaky")
+
+    thread_manager = ThreadManager(max_pool_threads=2)
+    policy = ThreadManager.RestartPolicy(max_restarts=3, backoff=0.01)
+    thread_manager.attach("flaky", flaky, should_terminate=True, restart=policy)
+    results = [thread_manager.submit(lambda x: x * x, x) for x in range(10)]
+    thread_manager.run()
+    assert len(attempts) == 3 and attempts[2] - attempts[1] >= 0.02
+    assert [future.result() for future in results] == [x * x for x in range(10)]
+    status = thread_manager.status()["flaky"]
+    assert not status["alive"] and status["restarts"] == 2
+
+    thread_manager = ThreadManager()
+    thread_manager.attach("broken", lambda: 1 / 0, should_terminate=True, restart=policy)
+    try:
+        thread_manager.run()
+        assert False
+    except ThreadManager.Error:
+        assert thread_manager.status()["broken"]["restarts"] == 3
+
+
+def test_thread_manager_cpu_time():
+    """Tests that CPU time is tracked for running and finished threads."""
+    var = MVar()
+
+    def spin():
+        deadline = time.thread_time() + 0.05
+        while time.thread_time() < deadline:
+            pass
+        var.swap(True)
+        var.read_newer(1)
+
+    thread_manager = ThreadManager()
+    thread_manager.attach("spin", spin, should_terminate=True)
+    run_thread = Thread(target=thread_manager.run, daemon=True)
+    run_thread.start()
+    var.read()
+    assert thread_manager.is_alive("spin")
+    running_cpu_time = thread_manager.cpu_time("spin")
+    assert math.isnan(running_cpu_time) or running_cpu_time >= 0.05
+    var.swap(False)
+    run_thread.join()
+    assert not thread_manager.is_alive("spin")
+    assert thread_manager.cpu_time("spin") >= 0.05
@@ -0,0 +1,224 @@
+"""The `trace` module.
+
+Latency tracing across the hops of the trading pipeline, from a book update or beat to the order
+acknowledged by the exchange.
+
+"""
+
+import itertools
+import math
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from trader.util.log import Log
+
+
+class LatencyHistogram:
+    """A histogram of latencies in log-spaced buckets.
+
+    Buckets span 1 microsecond to 100 seconds with ten buckets per decade, so quantiles are accurate
+    to within about 26%. Latencies outside that range fall into the first or last bucket.
+
+    """
+
+    __min_exponent = -6
+    __buckets_per_decade = 10
+    __num_buckets = 8 * __buckets_per_decade
+
+    def __init__(self):
+        self.__counts = [0] * LatencyHistogram.__num_buckets
+        self.__count = 0
+        self.__total = 0.0
+        self.__min = math.inf
+        self.__max = -math.inf
+
+    @staticmethod
+    def __bucket(seconds):
+        if seconds <= 0:
+            return 0
+        position = (math.log10(seconds) - LatencyHistogram.__min_exponent) * (
+            LatencyHistogram.__buckets_per_decade
+        )
+        return min(max(int(position), 0), LatencyHistogram.__num_buckets - 1)
+
+    @staticmethod
+    def __upper_bound(bucket):
+        return 10 ** (
+            LatencyHistogram.__min_exponent + (bucket + 1) / LatencyHistogram.__buckets_per_decade
+        )
+
+    def record(self, seconds):
+        self.__counts[LatencyHistogram.__bucket(seconds)] += 1
+        self.__count += 1
+        self.__total += seconds
+        self.__min = min(self.__min, seconds)
+        self.__max = max(self.__max, seconds)
+
+    @property
+    def count(self):
+        return self.__count
+
+    @property
+    def mean(self):
+        return self.__total / self.__count if self.__count else math.nan
+
+    @property
+    def min(self):
+        return self.__min if self.__count else math.nan
+
+    @property
+    def max(self):
+        return self.__max if self.__count else math.nan
+
+    def quantile(self, q):
+        """An upper bound on the `q` quantile of recorded latencies, in seconds."""
+        if not self.__count:
+            return math.nan
+        rank = q * self.__count
+        seen = 0
+        for bucket, count in enumerate(self.__counts):
+            seen += count
+            if count and seen >= rank:
+                return min(LatencyHistogram.__upper_bound(bucket), self.__max)
+        return self.__max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "min": self.min,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+        }
+
+
+class Tracer:
+    """Collects per-hop latency histograms from traces through the pipeline.
+
+    A trace is an id that is stamped as it passes each hop, with times from `time.monotonic`. Each
+    stamp records the time since the trace's previous stamp in the histogram of that hop. A trace
+    may be forked, e.g. into one trace per order sent on a tick, and should be finished once it is
+    done. Finishing a trace with a hop records the time since the trace (or the trace it was forked
+    from) started, e.g. from a book update to the acknowledgement of the order it led to. Stamps on
+    unknown or finished traces are ignored, and only the latest `max_traces` open traces are kept.
+
+    Args:
+        max_traces (int): The maximum number of open traces.
+
+    """
+
+    def __init__(self, max_traces=10000):
+        self.__lock = Lock()
+        self.__ids = itertools.count()
+        self.__max_traces = max_traces
+        self.__traces = OrderedDict()
+        self.__histograms = OrderedDict()
+
+    def __open(self, started_at, at):
+        trace_id = next(self.__ids)
+        self.__traces[trace_id] = (started_at, at)
+        if len(self.__traces) > self.__max_traces:
+            self.__traces.popitem(last=False)
+        return trace_id
+
+    def __record(self, hop, seconds):
+        if hop not in self.__histograms:
+            self.__histograms[hop] = LatencyHistogram()
+        self.__histograms[hop].record(seconds)
+
+    def start(self, at=None):
+        """Starts a trace at time `at` (now by default) and returns its id."""
+        at = time.monotonic() if at is None else at
+        with self.__lock:
+            return self.__open(at, at)
+
+    def stamp(self, trace_id, hop, at=None, record=True):
+        """Records the time from the previous stamp of a trace to `hop`. With `record` False, only
+        moves the trace on to `hop`, for hops whose latencies are recorded outside of traces."""
+        at = time.monotonic() if at is None else at
+        with self.__lock:
+            trace = self.__traces.get(trace_id)
+            if trace is None:
+                return
+            started_at, last = trace
+            if record:
+                self.__record(hop, at - last)
+            self.__traces[trace_id] = (started_at, at)
+
+    def fork(self, trace_id):
+        """Starts a new trace from the latest stamp of `trace_id`, and returns its id."""
+        with self.__lock:
+            trace = self.__traces.get(trace_id)
+            if trace is None:
+                now = time.monotonic()
+                return self.__open(now, now)
+            return self.__open(*trace)
+
+    def finish(self, trace_id, hop=None, at=None):
+        """Closes a trace, recording the time since it started to `hop` if given."""
+        at = time.monotonic() if at is None else at
+        with self.__lock:
+            trace = self.__traces.pop(trace_id, None)
+            if trace is not None and hop is not None:
+                self.__record(hop, at - trace[0])
+
+    def record(self, hop, seconds):
+        """Records a latency for `hop` outside of any trace."""
+        with self.__lock:
+            self.__record(hop, seconds)
+
+    def histogram(self, hop):
+        """The latency histogram of `hop`, or None if it has not been stamped."""
+        return self.__histograms.get(hop)
+
+    def summary(self):
+        """Latency summaries of every hop, in the order the hops were first stamped."""
+        with self.__lock:
+            return OrderedDict((hop, h.summary()) for hop, h in self.__histograms.items())
+
+    def dump(self):
+        Log.info("latencies", dict(self.summary()))
+
+    def reset(self):
+        with self.__lock:
+            self.__histograms.clear()
+
+
+# The tracer shared by every component.
+TRACER = Tracer()
+
+
+def test_tracer():
+    """Tests stamping, forking and summarizing traces."""
+    tracer = Tracer(max_traces=3)
+    tick = tracer.start(at=10.0)
+    tracer.stamp(tick, "signals", at=10.002)
+    tracer.stamp(tick, "decision", at=10.003)
+    orders = [tracer.fork(tick) for _ in range(2)]
+    tracer.stamp(orders[0], "order_ack", at=10.05)
+    tracer.stamp(orders[1], "order_ack", at=10.5)
+    tracer.finish(tick)
+    for trace_id in orders:
+        tracer.finish(trace_id, "order_total", at=10.5)
+    tracer.stamp(tick, "signals", at=11.0)
+
+    summary = tracer.summary()
+    assert list(summary) == ["signals", "decision", "order_ack", "order_total"]
+    assert summary["signals"]["count"] == 1
+    assert math.isclose(summary["signals"]["mean"], 0.002)
+    ack = tracer.histogram("order_ack")
+    assert ack.count == 2 and math.isclose(ack.max, 0.497)
+    assert 0.047 <= ack.quantile(0.5) <= 0.047 * 1.26
+    assert ack.quantile(1) == ack.max
+    # Forks measure their totals from the start of the trace they were forked from.
+    assert tracer.histogram("order_total").count == 2
+    assert math.isclose(tracer.histogram("order_total").min, 0.5)
+
+    # Only the latest traces are kept open.
+    traces = [tracer.start(at=0.0) for _ in range(4)]
+    tracer.stamp(traces[0], "evicted", at=1.0)
+    tracer.stamp(traces[-1], "kept", at=1.0)
+    assert tracer.histogram("evicted") is None and tracer.histogram("kept").count == 1
@@ -4,6 +4,8 @@ Miscellaneous wrapper types.
 
 """
 
+import time
+from collections import namedtuple
 from enum import Enum
 
 from sortedcontainers import SortedList
@@ -187,6 +189,14 @@ class Side(Enum):
         return Side.BUY
 
 
+# An immutable snapshot of the best levels of an `OrderBook`. Prices and sizes are NaN for an empty
+# side, and `received_at` is None if unknown. `published_at` is the `time.monotonic` time at which
+# the update was applied to the book.
+TopOfBook = namedtuple(
+    "TopOfBook", ["bid", "bid_size", "ask", "ask_size", "received_at", "published_at"]
+)
+
+
 class OrderBook:
     """An immutable order book.
 
@@ -196,13 +206,16 @@ class OrderBook:
         exchange_pair (ExchangePair): exchange pair
         bids (SortedList<BookLevel>): Bids, sorted and aggregated.
         asks (SortedList<BookLevel>): Asks, sorted and aggregated.
+        received_at (float): `time.monotonic` time at which the latest update was received, if
+            known.
 
     """
 
-    def __init__(self, exchange_pair, bids=[], asks=[]):
+    def __init__(self, exchange_pair, bids=[], asks=[], received_at=None):
         self.__exchange_pair = exchange_pair
         self.__bids = SortedList(bids, key=lambda x: -x.price)
         self.__asks = SortedList(asks, key=lambda x: x.price)
+        self.mark_received(received_at)
 
     # You could probably implement __eq__, but when would you need it?
     def __eq__(self, other):
@@ -233,6 +246,25 @@ class OrderBook:
     def quote(self):
         return self.exchange_pair.quote
 
+    @property
+    def received_at(self):
+        return self.__received_at
+
+    @property
+    def top(self):
+        """The `TopOfBook` as of the last call to `mark_received`. Safe to read from any thread."""
+        return self.__top
+
+    def mark_received(self, received_at):
+        """Marks the book as received at `received_at`, and snapshots its top of book. The thread
+        updating the book should call this once it is done with each update."""
+        self.__received_at = received_at
+        bid = self.__bids[0] if self.__bids else BookLevel(float("nan"), float("nan"))
+        ask = self.__asks[0] if self.__asks else BookLevel(float("nan"), float("nan"))
+        self.__top = TopOfBook(
+            bid.price, bid.size, ask.price, ask.size, received_at, time.monotonic()
+        )
+
     def clear(self):
         self.__bids.clear()
         self.__asks.clear()